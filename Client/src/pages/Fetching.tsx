@@ -60,6 +60,8 @@ export default function Fetching() {
 		status: "unknown",
 		latlng: [0, 0],
 		waypoints: [],
+		progress: 0,
+		total: 0,
 	})
 
 	// Retrieve saved map state or use default
@@ -92,17 +94,26 @@ export default function Fetching() {
 		onMessageArrived: (topic, message) => {
 			try {
 				const parsedMessage = JSON.parse(message)
-				if (!(parsedMessage.status && parsedMessage.latlng)) {
+				// The waypoint list arrives once (retained) on its own topic
+				if (topic.endsWith("/telemetry/plan")) {
+					setRoverState((state) => ({ ...state, waypoints: parsedMessage.waypoints ?? [] }))
 					return
 				}
-				if (["status", "latlng", "waypoints"].every((key) => key in parsedMessage)) {
-					setRoverState(parsedMessage)
+				if (!(parsedMessage.status && parsedMessage.latlng)) {
+					return
 				}
+				setRoverState((state) => ({
+					...state,
+					status: parsedMessage.status,
+					latlng: parsedMessage.latlng,
+					progress: parsedMessage.progress,
+					total: parsedMessage.total,
+				}))
 			} catch (err) {
 				console.error("Message parsing error:", err)
 			}
 		},
-		channels: [`ground/${roverId}/telemetry`],
+		channels: [`ground/${roverId}/telemetry`, `ground/${roverId}/telemetry/plan`],
 	})
 
 	useEffect(() => {
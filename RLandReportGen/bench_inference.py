@@ -0,0 +1,143 @@
+"""
+Measure recommendation throughput against the number of inference processes,
+and the memory each process really costs (RSS and PSS from
+/proc/<pid>/smaps_rollup, so Linux only).
+
+    python bench_inference.py --workers 0 1 2 4 --requests 400 --plots 50
+    python bench_inference.py --synthetic --trees 300 --workers 0 2 4
+
+--synthetic trains a random forest on random data and saves it uncompressed
+into a temporary model directory, for machines without the trained model.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import numpy as np
+from last import FEATURES, CropRecommendationFromMQTT
+
+BASIN = "Cauvery Basin"
+
+
+def train_synthetic(directory, trees):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 200, size=(20000, len(FEATURES)))
+    labels = rng.choice(["Rice", "Maize", "Sugarcane", "Cotton", "Ragi", "Groundnut"], size=len(features))
+    scaler = StandardScaler().fit(features)
+    model = RandomForestClassifier(n_estimators=trees, random_state=0).fit(scaler.transform(features), labels)
+    # Uncompressed, like a model meant to be loaded with mmap_mode
+    joblib.dump(model, os.path.join(directory, f"{BASIN}_model.joblib"))
+    joblib.dump(scaler, os.path.join(directory, f"{BASIN}_scaler.joblib"))
+
+
+def memory_kb(pid):
+    """Rss and Pss in kB of a process."""
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                usage[key] = int(value.split()[0])
+    return usage
+
+
+def make_survey(index, plots, rng):
+    """A rover survey as the server sends it: a row of plots with measured soil readings."""
+    lat = 12.52 + index * 1e-3
+    return [
+        {
+            "plot_id": f"PLOT_{lat}_{76.89 + i * 1e-4:.4f}",
+            "details": {
+                "lat": lat,
+                "lon": 76.89 + i * 1e-4,
+                "nitrogen_ppm": int(rng.integers(10, 100)),
+                "phosphorus_ppm": int(rng.integers(10, 70)),
+                "potassium_ppm": int(rng.integers(50, 250)),
+                "soil_pH": round(float(rng.uniform(5.5, 8.0)), 2),
+            },
+        }
+        for i in range(plots)
+    ]
+
+
+def run(model_dir, processes, requests, plots, threads):
+    recommender = CropRecommendationFromMQTT(
+        model_save_dir=model_dir, zone_count=None, inference_processes=processes
+    )
+    recommender.start_inference_pool()
+
+    rng = np.random.default_rng(0)
+    surveys = [make_survey(i, plots, rng) for i in range(requests)]
+    # Warm up every process so its copy-on-write view of the model is paged in
+    for survey in surveys[: max(processes, 1) * 2]:
+        recommender.recommend_request(survey)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(recommender.recommend_request, surveys))
+    elapsed = time.perf_counter() - start
+
+    # Re-send some surveys: every plot should now come from the result cache
+    before = recommender.metrics()["result_cache"]
+    for repeat in surveys[:10]:
+        recommender.recommend_request(repeat)
+    after = recommender.metrics()["result_cache"]
+    repeat_hits = after["hits"] - before["hits"]
+    repeat_lookups = repeat_hits + after["misses"] - before["misses"]
+
+    pids = [child.pid for child in multiprocessing.active_children()] or [os.getpid()]
+    usage = [memory_kb(pid) for pid in pids]
+    if recommender.pool is not None:
+        recommender.pool.terminate()
+        recommender.pool.join()
+
+    return {
+        "throughput": requests / elapsed,
+        "plots_per_s": requests * plots / elapsed,
+        "rss_mb": np.mean([u["Rss"] for u in usage]) / 1024,
+        "pss_mb": np.mean([u["Pss"] for u in usage]) / 1024,
+        "parent": memory_kb(os.getpid()),
+        "repeat_hit_rate": repeat_hits / repeat_lookups if repeat_lookups else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model-dir", default="cauvery_basin_models")
+    parser.add_argument("--workers", nargs="+", type=int, default=[0, 1, 2, 4],
+                        help="Inference process counts to try (0 = in the calling threads)")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--plots", type=int, default=50, help="Plots per request")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent request threads")
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--trees", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = args.model_dir
+        if args.synthetic:
+            model_dir = tmp
+            train_synthetic(model_dir, args.trees)
+
+        print(
+            f"{'workers':>8} {'req/s':>8} {'plots/s':>9} {'RSS MB':>8} {'PSS MB':>8} "
+            f"{'parent RSS MB':>14} {'re-sent hits':>13}"
+        )
+        for processes in args.workers:
+            result = run(model_dir, processes, args.requests, args.plots, args.threads)
+            print(
+                f"{processes:>8} {result['throughput']:>8.1f} {result['plots_per_s']:>9.0f} "
+                f"{result['rss_mb']:>8.1f} {result['pss_mb']:>8.1f} {result['parent']['Rss'] / 1024:>14.1f} "
+                f"{result['repeat_hit_rate']:>12.0%}"
+            )
+    print("RSS and PSS are per inference process (or the parent with 0 workers); PSS splits shared pages.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,174 @@
 import paho.mqtt.client as mqtt
 import json
+import hashlib
 import numpy as np
 import joblib
+import multiprocessing
 import os
+import queue
 import time
 import threading
+from collections import OrderedDict, deque
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.neighbors import NearestNeighbors, radius_neighbors_graph
 from sklearn.preprocessing import StandardScaler
 import random
 from datetime import datetime
 import geopy.geocoders
+import shapely
+from shapely.geometry import box
+from shapely.ops import unary_union
+
+# Model input columns, in training order
+FEATURES = ['nitrogen', 'phosphorus', 'potassium',
+            'temperature', 'rainfall', 'ph',
+            'latitude', 'longitude']
+
+# Rovers do not measure climate; missing values get the middle of the basin's
+# range instead of a random draw, so the same plot always scores (and caches) the same
+DEFAULT_TEMPERATURE = 27.5
+DEFAULT_RAINFALL = 125.0
+
+# Resolution of each feature for result caching: sensor precision for the
+# readings, ~10 m for position, so re-sent and near-identical plots share a key
+FEATURE_PRECISION = np.array([1, 1, 1, 0.1, 1, 0.01, 1e-4, 1e-4])
+
+class RecommendationCache:
+    """Thread-safe LRU cache with a time-to-live and hit/miss counters."""
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Recommender inherited by forked inference processes
+_shared_recommender = None
+
+def _recommend(message):
+    """
+    Handle a request in a pool process, with the model it inherited at fork
+    time. Returns the response with this process's feature cache counters.
+    """
+    response = _shared_recommender.recommend(message)
+    return response, os.getpid(), _shared_recommender.result_cache.stats()
+
+# Measured soil columns used, together with position, to group plots into zones
+ZONE_FEATURES = ['nitrogen', 'phosphorus', 'potassium', 'ph']
+
+# Cell corners are snapped to this grid (degrees, ~0.1 mm) so neighbouring cells share edges exactly
+CELL_PRECISION = 1e-9
+
+def plot_cells(positions):
+    """
+    Rectangular (lon, lat) cells, one around each plot, sized to the spacing
+    between neighbouring plots along each axis so that the cells tile the
+    surveyed area.
+    """
+    positions = np.asarray(positions, dtype=float)
+    half_lat = half_lon = 5e-5
+    if len(positions) >= 2:
+        lon_scale = np.cos(np.radians(positions[:, 0].mean()))
+        planar = np.column_stack([positions[:, 0], positions[:, 1] * lon_scale])
+        _, neighbours = NearestNeighbors(n_neighbors=min(5, len(planar))).fit(planar).kneighbors(planar)
+        offsets = np.abs(planar[neighbours[:, 1:]] - planar[:, None, :]).reshape(-1, 2)
+        # A neighbour mostly north/south gives the row spacing, mostly east/west the column spacing
+        along_lat = offsets[offsets[:, 0] > offsets[:, 1], 0]
+        along_lon = offsets[offsets[:, 1] > offsets[:, 0], 1]
+        spacing = np.median(np.linalg.norm(offsets, axis=1))
+        half_lat = (np.median(along_lat) if len(along_lat) else spacing) / 2 or half_lat
+        half_lon = (np.median(along_lon) if len(along_lon) else spacing) / 2 / lon_scale or half_lon
+
+    cells = [box(lon - half_lon, lat - half_lat, lon + half_lon, lat + half_lat) for lat, lon in positions.tolist()]
+    return list(shapely.set_precision(cells, CELL_PRECISION))
+
+def zone_polygons(cells):
+    """
+    Dissolve a zone's plot cells into its outline: a list of polygons, each
+    as [lat, lon] rings with the exterior first and any holes after it.
+    """
+    outline = unary_union(cells).simplify(0)
+    parts = getattr(outline, 'geoms', [outline])
+    return [
+        [[[lat, lon] for lon, lat in ring.coords] for ring in [part.exterior, *part.interiors]]
+        for part in parts
+        if not part.is_empty
+    ]
 
 class CropRecommendationFromMQTT:
-    def __init__(self, mqtt_host='100.109.46.43', mqtt_port=1883, model_save_dir='cauvery_basin_models'):
+    def __init__(self, mqtt_host='100.109.46.43', mqtt_port=1883, model_save_dir='cauvery_basin_models', zone_count=4,
+                 workers=4, queue_size=100, metrics_interval=30, inference_processes=0):
         self.mqtt_host = mqtt_host
         self.mqtt_port = mqtt_port
-        self.request_topic = "ai/crops/255/request"
-        self.response_topic = "ai/crops/255/response"
+        # Management zones per survey; None recommends for every plot instead
+        self.zone_count = zone_count
+        # Weight of position against soil readings when clustering plots
+        self.zone_spatial_weight = 1.0
+        # Plots only merge into a zone with plots within this many plot spacings, so zones stay contiguous
+        self.zone_neighbour_radius = 1.2
+        # One service answers every rover: ai/crops/<rover_id>/request -> .../response
+        self.request_topic = "ai/crops/+/request"
+        self.metrics_topic = "ai/crops/metrics"
         self.model_save_dir = model_save_dir
 
+        # Requests are handled by a bounded pool of threads sharing the model
+        self.workers = workers
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.metrics_interval = metrics_interval
+        self.metrics_lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=1000)
+
+        # Probabilities per quantized feature vector, and whole responses per request payload
+        self.result_cache = RecommendationCache(max_entries=100000, ttl=24 * 3600)
+        # Latest feature cache counters of each pool process, by pid
+        self.pool_cache_stats = {}
+        self.response_cache = RecommendationCache(max_entries=1000, ttl=600)
+
         # Store incoming data
         self.soil_data_buffer = []
         self.buffer_lock = threading.Lock()
 
+        # Optional pool of forked processes that handle requests; 0 keeps them in the worker threads
+        self.inference_processes = inference_processes
+        self.pool = None
+
         # Load the trained model and scaler
-        self.basin_model, self.scaler = self.load_model("Cauvery Basin")
+        mmap_mode = 'r' if inference_processes else None
+        self.basin_model, self.scaler = self.load_model("Cauvery Basin", mmap_mode=mmap_mode)
 
         # Initialize geolocator
         self.geolocator = geopy.geocoders.Nominatim(user_agent="crop_recommendation_system")
@@ -71,14 +216,21 @@ class CropRecommendationFromMQTT:
             }
         }
 
-    def load_model(self, basin_name):
+    def load_model(self, basin_name, mmap_mode=None):
+        """
+        Load the basin model and scaler. With mmap_mode='r', plain numpy array
+        attributes stored in uncompressed joblib files are mapped read-only
+        instead of copied. Tree models copy their node arrays when unpickled,
+        so for them this changes nothing; forked inference processes share the
+        model through copy-on-write of the parent's pages instead.
+        """
         try:
             model_path = os.path.join(self.model_save_dir, f'{basin_name}_model.joblib')
             scaler_path = os.path.join(self.model_save_dir, f'{basin_name}_scaler.joblib')
 
             if os.path.exists(model_path) and os.path.exists(scaler_path):
-                basin_model = joblib.load(model_path)
-                scaler = joblib.load(scaler_path)
+                basin_model = joblib.load(model_path, mmap_mode=mmap_mode)
+                scaler = joblib.load(scaler_path, mmap_mode=mmap_mode)
                 print(f"Models for {basin_name} loaded successfully.")
                 return basin_model, scaler
             else:
@@ -95,8 +247,8 @@ class CropRecommendationFromMQTT:
                 'phosphorus': soil_data.get('phosphorus', soil_data.get('phosphorus_ppm', round(random.uniform(30, 100), 2))),
                 'potassium': soil_data.get('potassium', soil_data.get('potassium_ppm', round(random.uniform(40, 120), 2))),
                 'ph': soil_data.get('ph', soil_data.get('soil_pH', round(random.uniform(6.0, 7.5), 2))),
-                'temperature': soil_data.get('temperature', round(random.uniform(20, 35), 2)),
-                'rainfall': soil_data.get('rainfall', round(random.uniform(50, 200), 2)),
+                'temperature': soil_data.get('temperature', DEFAULT_TEMPERATURE),
+                'rainfall': soil_data.get('rainfall', DEFAULT_RAINFALL),
                 'latitude': soil_data.get('latitude', soil_data.get('lat', 12.2958)),
                 'longitude': soil_data.get('longitude', soil_data.get('lon', 76.6394))
             }
@@ -111,8 +263,8 @@ class CropRecommendationFromMQTT:
                     'phosphorus': soil_data[1] if len(soil_data) > 1 else round(random.uniform(30, 100), 2),
                     'potassium': soil_data[2] if len(soil_data) > 2 else round(random.uniform(40, 120), 2),
                     'ph': soil_data[3] if len(soil_data) > 3 else round(random.uniform(6.0, 7.5), 2),
-                    'temperature': soil_data[4] if len(soil_data) > 4 else round(random.uniform(20, 35), 2),
-                    'rainfall': soil_data[5] if len(soil_data) > 5 else round(random.uniform(50, 200), 2),
+                    'temperature': soil_data[4] if len(soil_data) > 4 else DEFAULT_TEMPERATURE,
+                    'rainfall': soil_data[5] if len(soil_data) > 5 else DEFAULT_RAINFALL,
                     'latitude': soil_data[6] if len(soil_data) > 6 else 12.2958,
                     'longitude': soil_data[7] if len(soil_data) > 7 else 76.6394
                 }
@@ -123,8 +275,8 @@ class CropRecommendationFromMQTT:
             'phosphorus': round(random.uniform(30, 100), 2),
             'potassium': round(random.uniform(40, 120), 2),
             'ph': round(random.uniform(6.0, 7.5), 2),
-            'temperature': round(random.uniform(20, 35), 2),
-            'rainfall': round(random.uniform(50, 200), 2),
+            'temperature': DEFAULT_TEMPERATURE,
+            'rainfall': DEFAULT_RAINFALL,
             'latitude': 12.2958,
             'longitude': 76.6394
         }
@@ -160,15 +312,151 @@ class CropRecommendationFromMQTT:
             return self.crop_recommendations[crop]['description'] + " May require soil amendments for optimal growth."
 
     def get_crop_recommendation(self, avg_data):
-        features = ['nitrogen', 'phosphorus', 'potassium', 
-                    'temperature', 'rainfall', 'ph', 
-                    'latitude', 'longitude']
-        input_features = [avg_data[feature] for feature in features]
-        input_scaled = self.scaler.transform([input_features])
-        predictions = self.basin_model.predict_proba(input_scaled)
-        top_indices = predictions[0].argsort()[-3:][::-1]
-        recommended_crops = [self.basin_model.classes_[idx] for idx in top_indices]
-        return recommended_crops
+        crops, _ = self.get_crop_recommendations_batch([avg_data])
+        return crops[0]
+
+    def get_crop_recommendations_batch(self, rows):
+        """
+        Recommend crops for many processed soil rows with a single scaler and
+        model call. Returns the top-3 crops per row and the probability matrix.
+        Rows are quantized to FEATURE_PRECISION; cached vectors are reused and
+        only the misses go to the model.
+        """
+        features = np.array([[row[feature] for feature in FEATURES] for row in rows], dtype=float)
+        quantized = np.round(features / FEATURE_PRECISION).astype(np.int64)
+        keys = [tuple(row) for row in quantized.tolist()]
+
+        cached = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(cached) if result is None]
+        if missing:
+            # Score the bin values, so a key always maps to the same result
+            computed = self.predict_proba(quantized[missing] * FEATURE_PRECISION)
+            for i, result in zip(missing, computed):
+                self.result_cache.put(keys[i], result)
+                cached[i] = result
+        probabilities = np.array(cached)
+        top_indices = np.argsort(probabilities, axis=1)[:, -3:][:, ::-1]
+        recommended_crops = self.basin_model.classes_[top_indices].tolist()
+        return recommended_crops, probabilities
+
+    def predict_proba(self, features):
+        return self.basin_model.predict_proba(self.scaler.transform(features))
+
+    def start_inference_pool(self):
+        """
+        Fork the processes that handle requests. Must run before any other
+        thread is started. Each child inherits this recommender, model
+        included, through copy-on-write pages, and does the whole request
+        (parsing, clustering, inference, descriptions) so the Python work
+        scales with the process count. The feature cache is then per process.
+        """
+        global _shared_recommender
+        if not self.inference_processes or self.pool is not None:
+            return
+        _shared_recommender = self
+        self.pool = multiprocessing.get_context('fork').Pool(self.inference_processes)
+
+    def recommend_request(self, message):
+        """Build the response for a parsed request, in the process pool when there is one."""
+        if self.pool is not None:
+            response, pid, cache_stats = self.pool.apply(_recommend, (message,))
+            with self.metrics_lock:
+                self.pool_cache_stats[pid] = cache_stats
+            return response
+        return self.recommend(message)
+
+    def top_crops(self, probabilities, count=3, weights=None):
+        """Top crops for a whole field from the (weighted) mean of per-plot or per-zone probabilities."""
+        mean_probabilities = np.average(probabilities, axis=0, weights=weights)
+        return self.basin_model.classes_[mean_probabilities.argsort()[-count:][::-1]].tolist()
+
+    def average_soil_data(self, rows):
+        return {feature: float(np.mean([row[feature] for row in rows])) for feature in FEATURES}
+
+    def process_plots(self, plots):
+        rows = []
+        for plot in plots:
+            soil_data = plot.get('details', plot) if isinstance(plot, dict) else plot
+            rows.append(self.process_soil_data(soil_data))
+        return rows
+
+    def recommend_for_plots(self, plots):
+        """
+        Batch recommendation for every plot the server sent: per-plot top-3
+        crops plus a field-level recommendation and averages.
+        """
+        rows = self.process_plots(plots)
+
+        plot_crops, probabilities = self.get_crop_recommendations_batch(rows)
+        plot_results = [
+            {
+                "plot_id": plot.get('plot_id') if isinstance(plot, dict) else None,
+                "latitude": row['latitude'],
+                "longitude": row['longitude'],
+                "crops": crops
+            }
+            for plot, row, crops in zip(plots, rows, plot_crops)
+        ]
+
+        avg_data = self.average_soil_data(rows)
+        return avg_data, self.top_crops(probabilities), plot_results
+
+    def cluster_zones(self, rows):
+        """
+        Group processed plot rows into spatially contiguous management zones:
+        Ward clustering of standardized position and soil readings, where
+        plots can only be merged with their adjacent plots on the ground.
+        Returns a zone label per row.
+        """
+        zone_count = min(self.zone_count, len(rows))
+        if zone_count <= 1:
+            return np.zeros(len(rows), dtype=int)
+
+        positions = np.array([[row['latitude'], row['longitude']] for row in rows], dtype=float)
+        positions[:, 1] *= np.cos(np.radians(positions[:, 0].mean()))
+        distances, _ = NearestNeighbors(n_neighbors=2).fit(positions).kneighbors(positions)
+        radius = self.zone_neighbour_radius * float(np.median(distances[:, 1]))
+        connectivity = radius_neighbors_graph(positions, radius, include_self=False)
+
+        features = np.array(
+            [[row['latitude'], row['longitude']] + [row[f] for f in ZONE_FEATURES] for row in rows],
+            dtype=float
+        )
+        scaled = StandardScaler().fit_transform(features)
+        scaled[:, :2] *= self.zone_spatial_weight
+        return AgglomerativeClustering(
+            n_clusters=zone_count, connectivity=connectivity, linkage='ward'
+        ).fit_predict(scaled)
+
+    def recommend_for_zones(self, plots):
+        """
+        Cluster the plots into zones and recommend crops once per zone from its
+        average reading, so model calls scale with zones rather than plots.
+        Each zone is published as the outline of its plots' cells.
+        """
+        rows = self.process_plots(plots)
+        labels = self.cluster_zones(rows)
+        cells = plot_cells([[row['latitude'], row['longitude']] for row in rows])
+
+        zone_ids = np.unique(labels)
+        zone_rows = [[row for row, label in zip(rows, labels) if label == zone] for zone in zone_ids]
+        centroids = [self.average_soil_data(members) for members in zone_rows]
+        zone_crops, probabilities = self.get_crop_recommendations_batch(centroids)
+
+        zones = []
+        for zone, members, centroid, crops in zip(zone_ids, zone_rows, centroids, zone_crops):
+            member_plots = [plot for plot, label in zip(plots, labels) if label == zone]
+            zones.append({
+                "zone": int(zone),
+                "plot_ids": [plot.get('plot_id') for plot in member_plots if isinstance(plot, dict)],
+                "polygons": zone_polygons([cell for cell, label in zip(cells, labels) if label == zone]),
+                "avg_values": centroid,
+                "crops": crops
+            })
+
+        sizes = [len(members) for members in zone_rows]
+        avg_data = self.average_soil_data(rows)
+        return avg_data, self.top_crops(probabilities, weights=sizes), zones
 
     def describe_crops(self, crops, avg_data):
         """
@@ -176,56 +464,144 @@ class CropRecommendationFromMQTT:
         """
         return {crop: self.evaluate_crop_suitability(crop, avg_data) for crop in crops}
 
-    def send_recommendation(self, client, avg_data, crops, cropsdetailed):
-        payload = {
+    def response_topic(self, rover_id):
+        return f"ai/crops/{rover_id}/response"
+
+    def build_recommendation(self, avg_data, crops, cropsdetailed, **extra):
+        return {
             "crops": crops,
             "avg_values": avg_data,
-            "cropsdetailed": cropsdetailed
+            "cropsdetailed": cropsdetailed,
+            **extra
         }
-        client.publish(self.response_topic, json.dumps(payload))
-        print(f"Sent recommendation to {self.response_topic}: {json.dumps(payload, indent=2)}")
+
+    def send_recommendation(self, client, rover_id, payload):
+        topic = self.response_topic(rover_id)
+        client.publish(topic, json.dumps(payload))
+        print(f"Sent recommendation to {topic}: {json.dumps(payload, indent=2)}")
 
     def on_connect(self, client, userdata, flags, rc):
         print(f"Connected to MQTT server with result code {rc}")
         client.subscribe(self.request_topic)
 
     def on_message(self, client, userdata, msg):
+        # Runs on the network thread: only queue the request
+        rover_id = msg.topic.split('/')[2]
         try:
-            # Parse the received message
-            message = json.loads(msg.payload.decode())
-            
-            # Robust handling of different input formats
-            if isinstance(message, dict):
-                # If it's a dictionary, check for 'details' or 'avg_values'
-                soil_data = message.get('details', message.get('avg_values', {}))
-            elif isinstance(message, list):
-                # If it's a list, use the first item
-                soil_data = message[0] if message else {}
+            self.requests.put_nowait((rover_id, msg.payload, time.monotonic()))
+        except queue.Full:
+            with self.metrics_lock:
+                self.dropped += 1
+            print(f"Request queue full, dropping request from rover {rover_id}")
+
+    def recommend(self, message):
+        """Build the response payload for a parsed request message."""
+        # A list is every plot of a survey: recommend per zone, or per plot in one batch
+        if isinstance(message, list) and message:
+            if self.zone_count:
+                avg_data, crops, zones = self.recommend_for_zones(message)
+                extra = {"zones": zones}
             else:
-                # Default to empty dict if no recognizable input
-                soil_data = {}
-            
-            # Process the soil data
-            processed_data = self.process_soil_data(soil_data)
-            
-            # Recommend crops based on the soil data
-            crops = self.get_crop_recommendation(processed_data)
-            cropsdetailed = self.describe_crops(crops, processed_data)
-            
-            # Send recommendation
-            self.send_recommendation(client, processed_data, crops, cropsdetailed)
-
-        except json.JSONDecodeError:
-            print("Invalid JSON received")
-        except Exception as e:
-            print(f"Error processing MQTT message: {e}")
+                avg_data, crops, plots = self.recommend_for_plots(message)
+                extra = {"plots": plots}
+            cropsdetailed = self.describe_crops(crops, avg_data)
+            return self.build_recommendation(avg_data, crops, cropsdetailed, **extra)
+
+        # Robust handling of different input formats
+        if isinstance(message, dict):
+            # If it's a dictionary, check for 'details' or 'avg_values'
+            soil_data = message.get('details', message.get('avg_values', {}))
+        else:
+            # Default to empty dict if no recognizable input
+            soil_data = {}
+
+        # Process the soil data
+        processed_data = self.process_soil_data(soil_data)
+
+        # Recommend crops based on the soil data
+        crops = self.get_crop_recommendation(processed_data)
+        cropsdetailed = self.describe_crops(crops, processed_data)
+        return self.build_recommendation(processed_data, crops, cropsdetailed)
+
+    def handle_request(self, client, rover_id, payload):
+        # The same survey sent again gets the same answer without recomputing
+        digest = hashlib.sha256(payload).hexdigest()
+        response = self.response_cache.get(digest)
+        if response is None:
+            response = self.recommend_request(json.loads(payload.decode()))
+            self.response_cache.put(digest, response)
+        self.send_recommendation(client, rover_id, response)
+
+    def worker(self, client):
+        while True:
+            rover_id, payload, received = self.requests.get()
+            ok = False
+            try:
+                self.handle_request(client, rover_id, payload)
+                ok = True
+            except json.JSONDecodeError:
+                print(f"Invalid JSON received from rover {rover_id}")
+            except Exception as e:
+                print(f"Error processing request from rover {rover_id}: {e}")
+            finally:
+                with self.metrics_lock:
+                    if ok:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+                    self.latencies.append(time.monotonic() - received)
+                self.requests.task_done()
+
+    def result_cache_stats(self):
+        """Feature cache counters: this process's, or summed over the pool processes that hold the caches."""
+        if self.pool is None:
+            return self.result_cache.stats()
+        with self.metrics_lock:
+            per_process = list(self.pool_cache_stats.values())
+        totals = {key: sum(s[key] for s in per_process) for key in ("size", "hits", "misses")}
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+        return totals
+
+    def metrics(self):
+        """Queue length, counters and latency (seconds, over recent requests)."""
+        with self.metrics_lock:
+            latencies = np.array(self.latencies)
+            stats = {
+                "queue_length": self.requests.qsize(),
+                "processed": self.processed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+            }
+        stats["result_cache"] = self.result_cache_stats()
+        stats["response_cache"] = self.response_cache.stats()
+        if len(latencies):
+            stats.update({
+                "latency_avg": float(latencies.mean()),
+                "latency_p95": float(np.percentile(latencies, 95)),
+                "latency_max": float(latencies.max()),
+            })
+        return stats
+
+    def report_metrics(self, client):
+        while True:
+            time.sleep(self.metrics_interval)
+            stats = self.metrics()
+            client.publish(self.metrics_topic, json.dumps(stats), retain=True)
+            print(f"Recommender metrics: {stats}")
 
     def start_listening(self):
+        self.start_inference_pool()
+
         client = mqtt.Client()
         client.on_connect = self.on_connect
         client.on_message = self.on_message
         client.connect(self.mqtt_host, self.mqtt_port, 60)
 
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, args=(client,), daemon=True).start()
+        threading.Thread(target=self.report_metrics, args=(client,), daemon=True).start()
+
         client.loop_forever()
 
 def main():
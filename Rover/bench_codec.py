@@ -0,0 +1,77 @@
+"""
+Compare payload size and encode/decode speed of the JSON and compact soil
+message formats.
+
+    python bench_codec.py --messages 20000
+"""
+import argparse
+import json
+import random
+import time
+import soil_codec
+
+
+def sample_message():
+    soil_type = random.choice(soil_codec.SOIL_TYPES)
+    lat = round(random.uniform(12.52, 12.53), 5)
+    lon = round(random.uniform(76.89, 76.90), 5)
+    return {
+        "plot_id": f"PLOT_{lat}_{lon}",
+        "scan_point": {"latitude": lat, "longitude": lon},
+        "details": {
+            "lat": lat + random.uniform(-1e-6, 1e-6),
+            "lon": lon + random.uniform(-1e-6, 1e-6),
+            "soil_type": soil_type,
+            "soil_pH": round(random.uniform(5.5, 8.0), 2),
+            "soil_colour": random.choice(soil_codec.SOIL_COLOURS),
+            "texture": random.choice(soil_codec.TEXTURES),
+            "organic_content": round(random.uniform(1.0, 3.5), 2),
+            "moisture_content": round(random.uniform(15.0, 35.0), 2),
+            "bulk_density": round(random.uniform(1.2, 1.5), 2),
+            "nitrogen_ppm": random.randint(10, 100),
+            "phosphorus_ppm": random.randint(10, 70),
+            "potassium_ppm": random.randint(50, 250),
+            "cation_exchange_capacity": round(random.uniform(10.0, 30.0), 2),
+            "electrical_conductivity": round(random.uniform(0.2, 1.2), 2),
+            "porosity": round(random.uniform(35.0, 50.0), 2),
+            "water_holding_capacity": round(random.uniform(25.0, 45.0), 2),
+            "irrigation_suitability": "Cauvery River Belt",
+        },
+    }
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    messages = [sample_message() for _ in range(args.messages)]
+
+    json_payloads, json_encode = timed(lambda m: json.dumps(m).encode(), messages)
+    _, json_decode = timed(json.loads, json_payloads)
+    compact_payloads, compact_encode = timed(soil_codec.encode, messages)
+    decoded, compact_decode = timed(soil_codec.decode, compact_payloads)
+
+    assert all(d["details"]["nitrogen_ppm"] == m["details"]["nitrogen_ppm"] for d, m in zip(decoded, messages))
+
+    n = args.messages
+    print(f"{'format':>8} {'avg bytes':>10} {'encode us':>10} {'decode us':>10}")
+    for name, payloads, enc, dec in (
+        ("json", json_payloads, json_encode, json_decode),
+        ("compact", compact_payloads, compact_encode, compact_decode),
+    ):
+        size = sum(len(p) for p in payloads) / n
+        print(f"{name:>8} {size:>10.1f} {enc / n * 1e6:>10.2f} {dec / n * 1e6:>10.2f}")
+
+    ratio = sum(len(p) for p in json_payloads) / sum(len(p) for p in compact_payloads)
+    print(f"compact payloads are {ratio:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark the vectorized chunking and scan-pattern generation against the
+original per-point Shapely loops, and check both give identical waypoints.
+
+    python bench_scan.py --sizes 0.002 0.005 0.01 --grid-size 0.0002
+"""
+import argparse
+import time
+import numpy as np
+from shapely.geometry import Point, Polygon, box
+from optimized import chunk_size, divide_polygon_into_chunks, generate_scan_pattern
+
+
+def legacy_divide_polygon_into_chunks(polygon, chunk_size):
+    min_lon, min_lat, max_lon, max_lat = polygon.bounds
+    chunk_polygons = []
+    chunk_id = 0
+    for lon in np.arange(min_lon, max_lon, chunk_size):
+        for lat in np.arange(min_lat, max_lat, chunk_size):
+            chunk = box(lon, lat, lon + chunk_size, lat + chunk_size)
+            if polygon.intersects(chunk):
+                intersection = polygon.intersection(chunk)
+                if not intersection.is_empty:
+                    chunk_id += 1
+                    chunk_polygons.append((chunk_id, intersection))
+    return chunk_polygons
+
+
+def legacy_generate_scan_pattern(chunk, grid_size):
+    min_lon, min_lat, max_lon, max_lat = chunk.bounds
+    scan_pattern = []
+    reverse = False
+    for lat in np.arange(min_lat, max_lat, grid_size):
+        row_points = []
+        for lon in np.arange(min_lon, max_lon, grid_size):
+            if chunk.contains(Point(lon, lat)):
+                row_points.append([lat, lon])
+        if reverse:
+            row_points.reverse()
+        scan_pattern.extend(row_points)
+        reverse = not reverse
+    return scan_pattern
+
+
+def field(size):
+    """An irregular field of roughly `size` x `size` degrees near Mandya."""
+    lat, lon = 12.523, 76.894
+    return Polygon(
+        [
+            (lon, lat),
+            (lon + size, lat + size * 0.1),
+            (lon + size * 0.9, lat + size),
+            (lon + size * 0.3, lat + size * 0.8),
+            (lon - size * 0.1, lat + size * 0.4),
+        ]
+    )
+
+
+def plan(polygon, grid_size, divide, scan):
+    start = time.perf_counter()
+    points = []
+    for _, chunk in divide(polygon, chunk_size):
+        points.extend(scan(chunk, grid_size))
+    return points, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.002, 0.005, 0.01])
+    parser.add_argument("--grid-size", type=float, default=0.0002)
+    args = parser.parse_args()
+
+    print(f"{'field deg':>10} {'points':>8} {'legacy s':>9} {'vector s':>9} {'speedup':>8} {'identical':>9}")
+    for size in args.sizes:
+        polygon = field(size)
+        legacy, legacy_time = plan(polygon, args.grid_size, legacy_divide_polygon_into_chunks, legacy_generate_scan_pattern)
+        vector, vector_time = plan(field(size), args.grid_size, divide_polygon_into_chunks, generate_scan_pattern)
+        identical = legacy == vector
+        print(
+            f"{size:>10} {len(vector):>8} {legacy_time:>9.3f} {vector_time:>9.3f} "
+            f"{legacy_time / vector_time:>7.1f}x {str(identical):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
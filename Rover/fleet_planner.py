@@ -0,0 +1,189 @@
+"""
+Split one survey polygon between several rovers and send each its own plan.
+
+The polygon is divided into the usual chunks, the chunks are ordered along a
+serpentine walk over the chunk columns (so consecutive chunks touch), and that
+sequence is cut into contiguous runs with roughly equal numbers of scan
+points. Each run goes to the rover whose start position is closest to it and
+is published on ground/<rover_id>/plan together with the planned route, which
+the rover drives as is, so every rover scans points of the same field grid.
+
+    python fleet_planner.py --rovers 1 2 3 --start 1:12.5231,76.8942 --dry-run
+"""
+import argparse
+import itertools
+import json
+import time
+from math import floor
+import paho.mqtt.client as mqtt
+from shapely.geometry import MultiPolygon
+from shapely.ops import unary_union
+from optimized import (
+    chunk_size,
+    divide_polygon_into_chunks,
+    generate_scan_pattern,
+    grid_size,
+    rover_speed,
+    validate_polygon,
+    waypoint_overhead,
+)
+from route_optimizer import distance_m, optimize_route, route_report
+from sendplan import broker_address, mqtt_keepalive, mqtt_port, polygon_coords
+
+
+def serpentine_order(polygon, chunk_polygons):
+    """Order chunks column by column, alternating direction, so neighbours in the list are adjacent."""
+    min_lon, min_lat, _, _ = polygon.bounds
+
+    def cell(chunk):
+        c_min_lon, c_min_lat, _, _ = chunk.bounds
+        column = floor((c_min_lon - min_lon) / chunk_size + 1e-9)
+        row = floor((c_min_lat - min_lat) / chunk_size + 1e-9)
+        return column, row if column % 2 == 0 else -row
+
+    return sorted(chunk_polygons, key=lambda item: cell(item[1]))
+
+
+def split_balanced(weights, parts):
+    """Cut a sequence into `parts` contiguous runs with near-equal total weight; returns run boundaries."""
+    total = sum(weights)
+    bounds = [0]
+    cumulative = 0
+    for index, weight in enumerate(weights):
+        target = total * len(bounds) / parts
+        if len(bounds) < parts and cumulative + weight / 2 >= target and index > bounds[-1]:
+            bounds.append(index)
+        cumulative += weight
+    while len(bounds) < parts:
+        bounds.append(len(weights))
+    bounds.append(len(weights))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def assign_runs(runs, rover_ids, starts):
+    """
+    Match runs to rovers minimizing the total distance from each rover's
+    start to the centre of its run (exhaustive for small fleets, greedy otherwise).
+    """
+    if not starts:
+        return dict(zip(rover_ids, runs))
+
+    centres = []
+    for run in runs:
+        points = [point for _, pattern in run for point in pattern] or [(0.0, 0.0)]
+        centres.append((sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)))
+
+    def cost(rover_id, run_index):
+        start = starts.get(rover_id)
+        return distance_m(start, centres[run_index]) if start else 0.0
+
+    if len(rover_ids) <= 7:
+        best = min(
+            itertools.permutations(range(len(runs))),
+            key=lambda perm: sum(cost(r, i) for r, i in zip(rover_ids, perm)),
+        )
+        return {rover_id: runs[i] for rover_id, i in zip(rover_ids, best)}
+
+    assignment = {}
+    free = set(range(len(runs)))
+    for rover_id in rover_ids:
+        choice = min(free, key=lambda i: cost(rover_id, i))
+        free.discard(choice)
+        assignment[rover_id] = runs[choice]
+    return assignment
+
+
+def plan_fleet(coords, rover_ids, starts=None):
+    """
+    Partition a polygon given as [lat, lon] pairs between rovers. Returns
+    {rover_id: (area, scan_points)} where area is a shapely (Multi)Polygon.
+    """
+    polygon = validate_polygon([(lon, lat) for lat, lon in coords])
+    if polygon is None:
+        raise ValueError("Invalid survey polygon")
+
+    chunk_polygons = serpentine_order(polygon, divide_polygon_into_chunks(polygon, chunk_size))
+    if len(chunk_polygons) < len(rover_ids):
+        raise ValueError(f"Only {len(chunk_polygons)} chunks for {len(rover_ids)} rovers; reduce chunk_size")
+
+    patterns = [generate_scan_pattern(chunk, grid_size) for _, chunk in chunk_polygons]
+    weights = [len(pattern) for pattern in patterns]
+
+    runs = [
+        [(chunk_polygons[i][1], patterns[i]) for i in range(start, end)]
+        for start, end in split_balanced(weights, len(rover_ids))
+    ]
+
+    plans = {}
+    for rover_id, run in assign_runs(runs, rover_ids, starts or {}).items():
+        area = unary_union([chunk for chunk, _ in run])
+        plans[rover_id] = (area, optimize_route([pattern for _, pattern in run]))
+    return plans
+
+
+def plan_payload(area, points):
+    """
+    The plan message for a rover: its area as [lat, lon] rings and the
+    planned [lat, lon] waypoints, which the rover uses instead of re-gridding.
+    """
+    parts = list(area.geoms) if isinstance(area, MultiPolygon) else [area]
+    rings = [[[lat, lon] for lon, lat in part.exterior.coords] for part in parts]
+    return {"polygons": rings, "waypoints": [[lat, lon] for lat, lon in points]}
+
+
+def publish_plans(plans):
+    client = mqtt.Client()
+    client.connect(broker_address, mqtt_port, mqtt_keepalive)
+    client.loop_start()
+    for rover_id, (area, points) in plans.items():
+        topic = f"ground/{rover_id}/plan"
+        if area.is_empty:
+            print(f"No area left for rover {rover_id}, skipping {topic}")
+            continue
+        info = client.publish(topic, json.dumps(plan_payload(area, points)), qos=1)
+        info.wait_for_publish(timeout=10)
+        print(f"Published plan to {topic}")
+    time.sleep(1)
+    client.loop_stop()
+    client.disconnect()
+
+
+def parse_start(value):
+    rover_id, position = value.split(":", 1)
+    lat, lon = (float(x) for x in position.split(","))
+    return rover_id, (lat, lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rovers", nargs="+", required=True, help="Rover ids to share the survey")
+    parser.add_argument("--polygon", help="JSON file with [lat, lon] pairs (defaults to sendplan.py's polygon)")
+    parser.add_argument("--start", action="append", default=[], type=parse_start, help="rover_id:lat,lon")
+    parser.add_argument("--dry-run", action="store_true", help="Print the partition without publishing")
+    args = parser.parse_args()
+
+    coords = polygon_coords
+    if args.polygon:
+        with open(args.polygon) as f:
+            coords = json.load(f)
+
+    plans = plan_fleet(coords, args.rovers, dict(args.start))
+
+    print(f"{'rover':>8} {'points':>8} {'distance m':>11} {'est. min':>9}")
+    slowest = total = 0.0
+    for rover_id, (_, points) in plans.items():
+        report = route_report(points, points, speed=rover_speed, waypoint_overhead=waypoint_overhead)
+        slowest = max(slowest, report["after_s"])
+        total += report["after_s"]
+        print(f"{rover_id:>8} {len(points):>8} {report['after_m']:>11.0f} {report['after_s'] / 60:>9.1f}")
+    print(
+        f"Fleet wall-clock estimate {slowest / 60:.1f} min vs at least "
+        f"{total / 60:.1f} min for the same work on one rover."
+    )
+
+    if not args.dry_run:
+        publish_plans(plans)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,21 @@ import random
 import json
 import time
 import threading
+import queue
 import paho.mqtt.client as mqtt
-from dronekit import connect, VehicleMode, LocationGlobalRelative
-from shapely.geometry import Polygon, Point, box
+from dronekit import connect, Command, VehicleMode, LocationGlobalRelative
+from pymavlink import mavutil
+import shapely
+from shapely.geometry import Polygon, mapping
+from shapely.ops import unary_union
 from shapely.validation import explain_validity
 import folium
 import numpy as np
 from math import sin, cos, sqrt, atan2, radians
+import soil_codec
+from scan_buffer import ScanBuffer
+from plan_cache import PlanCache
+from route_optimizer import optimize_route, orient_route, route_report
 
 # Global variables
 vehicle = None
@@ -18,10 +26,33 @@ mqtt_port = 1883
 mqtt_keepalive = 60
 grid_size = 0.0002  # Grid resolution for scan pattern
 chunk_size = 0.001  # Chunk size for dividing polygon
-publish_interval = 1  # Interval for real-time data publishing (in seconds)
+publish_interval = 5  # Telemetry heartbeat: republish unchanged status after this many seconds
+telemetry_max_rate = 2  # Status changes are published at most this many times per second
 map_location = (12.524, 76.895)  # Center of the map for visualization
+acceptance_radius = 1  # Distance (m) at which a waypoint counts as reached
+waypoint_timeout = 300  # Give up on a waypoint after this many seconds
+stall_timeout = 30  # Give up if the rover gets no closer for this many seconds
+stall_progress = 0.5  # Metres the rover must close in to count as progress
+plan_visualization = "geojson"  # "geojson", "png", "html" or None to skip
+mission_mode = False  # Upload scan points as an AUTO mission instead of GUIDED gotos
+mission_max_items = 500  # Waypoints per uploaded mission segment (autopilot limit)
 polygon_coords = None  # To be received via MQTT
+planned_waypoints = None  # [lat, lon] route sent with a fleet plan, driven instead of re-gridding
 polygon_received_event = threading.Event()  # Event to signal polygon reception
+data_encoding = "json"  # "json" or "compact" (binary soil_codec, falls back to JSON per message)
+store_and_forward = True  # Buffer scan data on disk and upload it in acknowledged batches
+scan_buffer_path = "scan_buffer.sqlite3"
+scan_buffer_max_messages = 100000  # Oldest readings are dropped beyond this
+forward_batch_size = 50  # Readings per uploaded batch
+forward_interval = 1  # Seconds between upload attempts when idle or offline
+scan_buffer = None
+plan_cache_enabled = True  # Reuse plans computed for the same polygon and grid parameters
+plan_cache_dir = "plan_cache"
+plan_cache_max_bytes = 64 * 1024 * 1024
+plan_cache = None
+optimize_route_order = True  # Reorder chunks and their scan direction to minimize travel
+rover_speed = 1.0  # Expected cruise speed (m/s) for mission time estimates
+waypoint_overhead = 5  # Expected seconds spent stopping and sampling at each waypoint
 
 # Mandya District Specific Soil Types
 SOIL_TYPES = [
@@ -40,7 +71,8 @@ SOIL_COLORS = {
 search_status = {
     "status": "unknown",
     "latlng": None,
-    "waypoints": []
+    "waypoints": [],
+    "progress": 0  # Index of the waypoint currently being driven to
 }
 def validate_polygon(coords):
     """
@@ -85,6 +117,23 @@ def validate_polygon(coords):
         print(f"Error creating polygon: {e}")
         return None
 
+def is_multi_polygon_plan(coords):
+    """True when the plan is a list of polygons (fleet partitions) rather than one ring."""
+    return bool(coords) and isinstance(coords[0][0], (list, tuple))
+
+def build_plan_polygon(coords):
+    """
+    Build the survey area from a single ring of (lon, lat) coordinates or,
+    for partitioned fleet plans, from several rings that are merged together.
+    """
+    if not is_multi_polygon_plan(coords):
+        return validate_polygon(coords)
+
+    parts = [validate_polygon(ring) for ring in coords]
+    if any(part is None for part in parts):
+        return None
+    return unary_union(parts)
+
 def print_polygon_details(coords):
     """Print detailed information about polygon coordinates"""
     print("Total coordinates:", len(coords))
@@ -121,7 +170,13 @@ def arm_and_set_mode(mode="GUIDED"):
     print("Vehicle armed.")
 
 def goto_location(lat, lon, alt=10):
-    """Navigate to a specific GPS location."""
+    """
+    Navigate to a specific GPS location and wait until the rover is within
+    acceptance_radius. Arrival is detected from location updates as they
+    arrive, so the next waypoint can be issued immediately. Returns False
+    if the rover stops making progress for stall_timeout seconds or does
+    not arrive within waypoint_timeout.
+    """
     global vehicle, search_status
     target_location = LocationGlobalRelative(lat, lon, alt)
     print(f"Navigating to: {lat}, {lon}")
@@ -130,15 +185,104 @@ def goto_location(lat, lon, alt=10):
     # Update current location in search status
     search_status["latlng"] = [lat, lon]
 
-    while True:
-        current_location = vehicle.location.global_frame
-        dist = get_distance_metres(current_location, target_location)
-        print(f"Distance to target: {dist:.2f}m")
+    arrived = threading.Event()
+    progress = {"closest": float("inf"), "at": time.monotonic()}
 
-        if dist < 1:  # Stop when close enough
-            print("Target reached!")
-            break
-        time.sleep(1)
+    def on_location(_vehicle, _name, location):
+        if location.lat is None or location.lon is None:
+            return
+        dist = get_distance_metres(location, target_location)
+        if dist < progress["closest"] - stall_progress:
+            progress["closest"] = dist
+            progress["at"] = time.monotonic()
+        if dist < acceptance_radius:
+            arrived.set()
+
+    vehicle.add_attribute_listener("location.global_frame", on_location)
+    try:
+        # The rover may already be there
+        on_location(vehicle, "location.global_frame", vehicle.location.global_frame)
+        deadline = time.monotonic() + waypoint_timeout
+        while not arrived.wait(timeout=1):
+            now = time.monotonic()
+            if now - progress["at"] > stall_timeout:
+                print(f"Stalled {progress['closest']:.2f}m from target, skipping waypoint.")
+                return False
+            if now > deadline:
+                print(f"Timed out {progress['closest']:.2f}m from target, skipping waypoint.")
+                return False
+        print("Target reached!")
+        return True
+    finally:
+        vehicle.remove_attribute_listener("location.global_frame", on_location)
+
+def plot_id_for(scan_point):
+    """Create a geospatial plot_id for a scan point."""
+    return f"PLOT_{round(scan_point[0],5)}_{round(scan_point[1], 5)}"
+
+def run_scan_mission(scan_points, alt=10):
+    """
+    Drive the scan as AUTO missions of up to mission_max_items waypoints.
+    Sampling is triggered by MISSION_ITEM_REACHED, so the rover drives
+    continuously and this thread only waits between segments. Returns False
+    if the mission was cut short because no waypoint was reached in time.
+    """
+    global vehicle, search_status
+    reached = queue.Queue()
+
+    def on_item_reached(_vehicle, _name, message):
+        reached.put(message.seq)
+
+    vehicle.add_message_listener("MISSION_ITEM_REACHED", on_item_reached)
+    try:
+        for start in range(0, len(scan_points), mission_max_items):
+            segment = scan_points[start:start + mission_max_items]
+            print(f"Uploading mission segment {start + 1}-{start + len(segment)} of {len(scan_points)}...")
+
+            cmds = vehicle.commands
+            cmds.clear()
+            for lat, lon in segment:
+                cmds.add(Command(
+                    0, 0, 0,
+                    mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                    mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+                    0, 0, 0, 0, 0, 0,
+                    lat, lon, alt,
+                ))
+            cmds.upload()
+
+            # Drain reports left over from the previous segment
+            while not reached.empty():
+                reached.get_nowait()
+
+            vehicle.commands.next = 1
+            vehicle.mode = VehicleMode("AUTO")
+
+            # Mission item 0 is home, so item n is segment[n - 1]
+            last_seq = 0
+            while last_seq < len(segment):
+                try:
+                    seq = reached.get(timeout=waypoint_timeout)
+                except queue.Empty:
+                    print(f"No waypoint reached for {waypoint_timeout}s, aborting mission.")
+                    vehicle.mode = VehicleMode("HOLD")
+                    return False
+                if seq <= last_seq or seq > len(segment):
+                    continue  # Repeated or unrelated report
+
+                last_seq = seq
+                scan_point = segment[seq - 1]
+                search_status["latlng"] = scan_point
+                search_status["progress"] = start + seq
+                try:
+                    publish_scan_data(scan_point, plot_id_for(scan_point))
+                except Exception as e:
+                    print(f"Error during scanning at point {scan_point}: {e}")
+
+        vehicle.mode = VehicleMode("HOLD")
+        return True
+    finally:
+        vehicle.remove_message_listener("MISSION_ITEM_REACHED", on_item_reached)
 
 def get_distance_metres(aLocation1, aLocation2):
     """Returns the ground distance in meters between two LocationGlobal objects."""
@@ -171,7 +315,7 @@ def on_connect(client, userdata, flags, rc):
 
 def on_message(client, userdata, msg):
     """Callback for when a PUBLISH message is received from the server."""
-    global polygon_coords, search_status
+    global polygon_coords, planned_waypoints, search_status
     try:
         # Decode and parse the incoming JSON payload
         payload = json.loads(msg.payload.decode())
@@ -180,19 +324,28 @@ def on_message(client, userdata, msg):
         if isinstance(payload, list) and len(payload) > 2:  # Ensure the payload is a valid list
             # Convert coordinates to (lon, lat) format
             polygon_coords = [(point[1], point[0]) for point in payload]
+            planned_waypoints = None
             
             # Print polygon details for debugging
             print_polygon_details(polygon_coords)
-            
-            # Validate polygon
-            polygon = validate_polygon(polygon_coords)
-            
-            if polygon is not None:
-                polygon_received_event.set()  # Signal that polygon is received
-            else:
-                print("Invalid polygon received. Waiting for valid coordinates.")
+        elif isinstance(payload, dict) and payload.get("polygons"):
+            # Partitioned fleet plan: several [lat, lon] rings for this rover
+            polygon_coords = [[(point[1], point[0]) for point in ring] for ring in payload["polygons"]]
+            # The planner's route for this area, on the grid of the whole field
+            planned_waypoints = payload.get("waypoints") or None
+            for ring in polygon_coords:
+                print_polygon_details(ring)
         else:
             print("Invalid payload format. Expected a list of [lat, lon] pairs.")
+            return
+
+        # Validate polygon
+        polygon = build_plan_polygon(polygon_coords)
+
+        if polygon is not None:
+            polygon_received_event.set()  # Signal that polygon is received
+        else:
+            print("Invalid polygon received. Waiting for valid coordinates.")
     except Exception as e:
         print(f"Error processing incoming message: {e}")
 
@@ -208,43 +361,79 @@ def subscribe_to_plan_topic():
     mqtt_client.subscribe(topic)
     print(f"Subscribed to topic: {topic}")
 
-def real_time_publisher():
-    """Publish real-time telemetry data in a separate thread."""
-    global vehicle, mqtt_client, search_status
+def telemetry_topic():
     try:
         rover_id = vehicle._handler.master.mav.srcSystem
     except AttributeError:
         rover_id = "UNKNOWN"
-    topic = f"ground/{rover_id}/telemetry"
+    return f"ground/{rover_id}/telemetry"
+
+def publish_plan(waypoints):
+    """Publish the full waypoint list once, retained, so late subscribers still get it."""
+    global mqtt_client
+    topic = f"{telemetry_topic()}/plan"
+    mqtt_client.publish(topic, json.dumps({"waypoints": waypoints}), qos=1, retain=True)
+    print(f"Published plan with {len(waypoints)} waypoints to {topic}")
+
+def real_time_publisher():
+    """
+    Publish a small status/position/progress message in a separate thread.
+    It goes out when something changed (at most telemetry_max_rate per second)
+    and otherwise as a heartbeat every publish_interval seconds. The waypoint
+    list itself is sent once by publish_plan.
+    """
+    global vehicle, mqtt_client, search_status
+    topic = telemetry_topic()
+    last_data = None
+    last_sent = 0
     while True:
         if vehicle:
             # Prepare telemetry packet with current search status
             data = {
                 "status": search_status["status"],
                 "latlng": search_status["latlng"],
-                "waypoints": search_status["waypoints"]
+                "progress": search_status["progress"],
+                "total": len(search_status["waypoints"])
             }
-            mqtt_client.publish(topic, json.dumps(data))
-            print(f"Real-Time Search Status Published: {data}")
-        time.sleep(publish_interval)
+            now = time.monotonic()
+            if data != last_data or now - last_sent >= publish_interval:
+                mqtt_client.publish(topic, json.dumps(data))
+                print(f"Real-Time Search Status Published: {data}")
+                last_data = data
+                last_sent = now
+        time.sleep(1 / telemetry_max_rate)
 
 def divide_polygon_into_chunks(polygon, chunk_size):
     """Divide the polygon into equal-sized chunks and assign IDs."""
     min_lon, min_lat, max_lon, max_lat = polygon.bounds
-    chunk_polygons = []
-    chunk_id = 0
 
-    for lon in np.arange(min_lon, max_lon, chunk_size):
-        for lat in np.arange(min_lat, max_lat, chunk_size):
-            chunk = box(lon, lat, lon + chunk_size, lat + chunk_size)
-            if polygon.intersects(chunk):
-                try:
-                    intersection = polygon.intersection(chunk)
-                    if not intersection.is_empty:
-                        chunk_id += 1
-                        chunk_polygons.append((chunk_id, intersection))
-                except Exception as e:
-                    print(f"Error during chunk intersection: {e}")
+    # Build every candidate chunk at once, ordered longitude-major like the
+    # original nested loop, and intersect them in bulk
+    lon_grid, lat_grid = np.meshgrid(
+        np.arange(min_lon, max_lon, chunk_size),
+        np.arange(min_lat, max_lat, chunk_size),
+        indexing="ij",
+    )
+    lon_grid, lat_grid = lon_grid.ravel(), lat_grid.ravel()
+    candidates = shapely.box(lon_grid, lat_grid, lon_grid + chunk_size, lat_grid + chunk_size)
+
+    shapely.prepare(polygon)
+    candidates = candidates[shapely.intersects(polygon, candidates)]
+    try:
+        intersections = shapely.intersection(polygon, candidates)
+    except Exception as e:
+        print(f"Error during bulk chunk intersection, falling back per chunk: {e}")
+        intersections = []
+        for chunk in candidates:
+            try:
+                intersections.append(polygon.intersection(chunk))
+            except Exception as e:
+                print(f"Error during chunk intersection: {e}")
+
+    chunk_polygons = []
+    for intersection in intersections:
+        if not intersection.is_empty:
+            chunk_polygons.append((len(chunk_polygons) + 1, intersection))
     return chunk_polygons
 
 def generate_scan_pattern(chunk, grid_size):
@@ -253,21 +442,16 @@ def generate_scan_pattern(chunk, grid_size):
     latitudes = np.arange(min_lat, max_lat, grid_size)
     longitudes = np.arange(min_lon, max_lon, grid_size)
 
-    scan_pattern = []
-    reverse = False  # Alternating flag for row direction
+    # Test every grid node in one vectorized call (rows are latitudes)
+    lon_grid, lat_grid = np.meshgrid(longitudes, latitudes)
+    shapely.prepare(chunk)
+    inside = shapely.contains_xy(chunk, lon_grid, lat_grid)
 
-    for lat in latitudes:
-        row_points = []
-        for lon in longitudes:
-            point = Point(lon, lat)
-            if chunk.contains(point):
-                row_points.append([lat, lon])
-        if reverse:
-            row_points.reverse()
-        scan_pattern.extend(row_points)
-        reverse = not reverse  # Switch direction for next row
+    # Boustrophedon: every other row is walked in reverse longitude order
+    inside[1::2] = inside[1::2, ::-1]
+    lon_grid[1::2] = lon_grid[1::2, ::-1]
 
-    return scan_pattern
+    return np.column_stack((lat_grid[inside], lon_grid[inside])).tolist()
 
 def generate_soil_data(plot_id):
     """Generate simulated soil data for Mandya District."""
@@ -336,6 +520,55 @@ def generate_soil_data(plot_id):
     }
     return data
 
+def encode_scan_message(message):
+    """Encode a scan message in the configured wire format."""
+    if data_encoding == "compact":
+        try:
+            return soil_codec.encode(message)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Compact encoding not possible, sending JSON: {e}")
+    return json.dumps(message)
+
+def encode_scan_batch(messages):
+    """Encode a batch of scan messages in the configured wire format."""
+    if data_encoding == "compact":
+        try:
+            return soil_codec.encode_batch(messages)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Compact encoding not possible, sending JSON: {e}")
+    return json.dumps({"batch": messages})
+
+def scan_forwarder():
+    """Upload buffered scan data in batches whenever the broker is reachable."""
+    global mqtt_client, scan_buffer
+    topic = f"ground/{vehicle._handler.master.mav.srcSystem}/data"
+    while True:
+        pending = scan_buffer.peek(forward_batch_size) if mqtt_client.is_connected() else []
+        if not pending:
+            time.sleep(forward_interval)
+            continue
+
+        ids = [row_id for row_id, _ in pending]
+        try:
+            info = mqtt_client.publish(topic, encode_scan_batch([m for _, m in pending]), qos=1)
+            info.wait_for_publish(timeout=10)
+            if info.is_published():
+                scan_buffer.ack(ids)
+                print(f"Uploaded {len(ids)} buffered readings, {len(scan_buffer)} pending.")
+                continue
+            print("Batch upload not acknowledged, will retry.")
+        except Exception as e:
+            print(f"Error uploading buffered scan data: {e}")
+        time.sleep(forward_interval)
+
+def drain_scan_buffer(timeout=30):
+    """Wait (up to `timeout` seconds) for the buffered readings to be uploaded."""
+    deadline = time.time() + timeout
+    while scan_buffer and len(scan_buffer) and time.time() < deadline:
+        time.sleep(0.5)
+    if scan_buffer and len(scan_buffer):
+        print(f"{len(scan_buffer)} readings left in {scan_buffer_path}; they will be sent on the next run.")
+
 def publish_scan_data(scan_point, plot_id):
     """Publish scan point and plot ID to MQTT."""
     global mqtt_client
@@ -352,35 +585,97 @@ def publish_scan_data(scan_point, plot_id):
             "details": soil_data["details"],
         }
 
+        if scan_buffer is not None:
+            # Queue for the forwarder so nothing is lost while out of range
+            scan_buffer.append(message)
+            print(f"Buffered Scan Data: {json.dumps(message, indent=4)}")
+            return
+
         # Publish to MQTT
-        mqtt_client.publish(topic, json.dumps(message))
+        mqtt_client.publish(topic, encode_scan_message(message))
         print(f"Published Scan Data: {json.dumps(message, indent=4)}")
     except Exception as e:
         print(f"Error publishing scan data: {e}")
 
-def visualize_chunks_and_scan(polygon_coords, chunk_polygons, scan_points):
-    """Visualize the chunks, polygon, and scan points on a Folium map."""
-    folium_map = folium.Map(location=map_location, zoom_start=17)
-
-    # Add the main polygon
-    folium.Polygon(locations=[(lat, lon) for lon, lat in polygon_coords], color='blue', fill=True, fill_opacity=0.3).add_to(folium_map)
-
-    # Add each chunk
-    for chunk_id, chunk in chunk_polygons:
-        folium.Polygon(
-            locations=[(point[1], point[0]) for point in chunk.exterior.coords],
-            color='green',
-            weight=2,
-            fill=True,
-            fill_opacity=0.2,
-        ).add_child(folium.Popup(f"Chunk ID: {chunk_id}")).add_to(folium_map)
+def plan_geojson(polygon_coords, chunk_polygons, scan_points):
+    """The plan as one GeoJSON FeatureCollection: field, chunks and the scan route as a single line."""
+    rings = polygon_coords if is_multi_polygon_plan(polygon_coords) else [polygon_coords]
+    features = [
+        {"type": "Feature", "properties": {"kind": "field"},
+         "geometry": {"type": "Polygon", "coordinates": [[list(point) for point in ring]]}}
+        for ring in rings
+    ]
+    features += [
+        {"type": "Feature", "properties": {"kind": "chunk", "chunk_id": chunk_id},
+         "geometry": mapping(chunk)}
+        for chunk_id, chunk in chunk_polygons
+    ]
+    features.append(
+        {"type": "Feature", "properties": {"kind": "route", "points": len(scan_points)},
+         "geometry": {"type": "LineString", "coordinates": [[lon, lat] for lat, lon in scan_points]}}
+    )
+    return {"type": "FeatureCollection", "features": features}
+
+def render_plan_png(polygon_coords, chunk_polygons, scan_points, path):
+    """Rasterize the plan; the file size depends on the image, not the number of points."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 8), dpi=100)
+    rings = polygon_coords if is_multi_polygon_plan(polygon_coords) else [polygon_coords]
+    for ring in rings:
+        ax.fill([lon for lon, _ in ring], [lat for _, lat in ring], color="blue", alpha=0.2)
+    for _, chunk in chunk_polygons:
+        for part in getattr(chunk, "geoms", [chunk]):
+            if hasattr(part, "exterior"):
+                x, y = part.exterior.xy
+                ax.plot(x, y, color="green", linewidth=0.8)
+    if scan_points:
+        route = np.asarray(scan_points)
+        ax.plot(route[:, 1], route[:, 0], color="red", linewidth=0.6, marker=".", markersize=2)
+    ax.set_aspect("equal")
+    ax.set_xlabel("Longitude")
+    ax.set_ylabel("Latitude")
+    fig.savefig(path, bbox_inches="tight")
+    plt.close(fig)
 
-    # Add scan points
-    for lat, lon in scan_points:
-        folium.CircleMarker(location=(lat, lon), radius=3, color='red', fill=True).add_to(folium_map)
+def visualize_chunks_and_scan(polygon_coords, chunk_polygons, scan_points):
+    """
+    Save the plan in the plan_visualization format: "geojson" (one
+    FeatureCollection), "png" (needs matplotlib) or "html" (Folium map with
+    the whole route drawn as one polyline and no per-point markers).
+    """
+    try:
+        if plan_visualization == "png":
+            try:
+                render_plan_png(polygon_coords, chunk_polygons, scan_points, "chunks_and_scan.png")
+                print("Map saved as 'chunks_and_scan.png'.")
+                return
+            except ImportError:
+                print("matplotlib not available, saving GeoJSON instead.")
+
+        if plan_visualization == "html":
+            folium_map = folium.Map(location=map_location, zoom_start=17)
+            folium.GeoJson(
+                plan_geojson(polygon_coords, chunk_polygons, []),
+                style_function=lambda feature: {
+                    "color": "blue" if feature["properties"]["kind"] == "field" else "green",
+                    "weight": 2,
+                    "fillOpacity": 0.2,
+                },
+            ).add_to(folium_map)
+            if scan_points:
+                folium.PolyLine(locations=scan_points, color="red", weight=2).add_to(folium_map)
+            folium_map.save("chunks_and_scan.html")
+            print("Map saved as 'chunks_and_scan.html'. Open this file to view the map.")
+            return
 
-    folium_map.save("chunks_and_scan.html")
-    print("Map saved as 'chunks_and_scan.html'. Open this file to view the map.")
+        with open("chunks_and_scan.geojson", "w") as f:
+            json.dump(plan_geojson(polygon_coords, chunk_polygons, scan_points), f)
+        print("Map saved as 'chunks_and_scan.geojson'.")
+    except Exception as e:
+        print(f"Error saving plan visualization: {e}")
 
 def perform_search():
     """Execute the search pattern."""
@@ -393,7 +688,7 @@ def perform_search():
 
     # Define the polygon with validation
     try:
-        polygon = validate_polygon(polygon_coords)
+        polygon = build_plan_polygon(polygon_coords)
         if polygon is None:
             print("Invalid polygon. Cannot proceed with search.")
             search_status["status"] = "error"
@@ -404,43 +699,92 @@ def perform_search():
         search_status["status"] = "error"
         return
 
-    # Divide the polygon into chunks
-    chunk_polygons = divide_polygon_into_chunks(polygon, chunk_size)
-    if not chunk_polygons:
-        print("No chunks generated. Check your polygon or chunk size.")
-        search_status["status"] = "error"
-        return
+    # Reuse the plan if this field was surveyed with the same parameters before
+    cache_key = None
+    cached_points = None
+    if plan_cache is not None and not planned_waypoints:
+        cache_key = plan_cache.key(
+            polygon, grid_size=grid_size, chunk_size=chunk_size, optimize_route=optimize_route_order
+        )
+        cached_points = plan_cache.get(cache_key)
+
+    if planned_waypoints:
+        # Fleet plans carry their route; gridding this rover's part again would misalign it
+        chunk_polygons = []
+        scan_points = [list(point) for point in planned_waypoints]
+        print(f"Using {len(scan_points)} scan points from the fleet plan.")
+    elif cached_points is not None:
+        chunk_polygons = []
+        scan_points = cached_points.tolist()
+        print(f"Loaded {len(scan_points)} scan points from the plan cache.")
+    else:
+        # Divide the polygon into chunks
+        chunk_polygons = divide_polygon_into_chunks(polygon, chunk_size)
+        if not chunk_polygons:
+            print("No chunks generated. Check your polygon or chunk size.")
+            search_status["status"] = "error"
+            return
 
-    print(f"Generated {len(chunk_polygons)} chunks.")
+        print(f"Generated {len(chunk_polygons)} chunks.")
+
+        # Generate scan points for all chunks
+        chunk_patterns = [generate_scan_pattern(chunk, grid_size) for chunk_id, chunk in chunk_polygons]
+        scan_points = [point for pattern in chunk_patterns for point in pattern]
+        if optimize_route_order:
+            planned_points = scan_points
+            scan_points = optimize_route(chunk_patterns)
+            report = route_report(planned_points, scan_points, speed=rover_speed, waypoint_overhead=waypoint_overhead)
+            print(
+                f"Route optimized: {report['before_m']:.0f} m -> {report['after_m']:.0f} m, "
+                f"estimated mission time {report['before_s'] / 60:.1f} -> {report['after_s'] / 60:.1f} min."
+            )
+
+        if not scan_points:
+            print("No scan points generated. Check grid size or chunks.")
+            search_status["status"] = "error"
+            return
 
-    # Generate scan points for all chunks
-    scan_points = []
-    for chunk_id, chunk in chunk_polygons:
-        scan_points.extend(generate_scan_pattern(chunk, grid_size))
+        print(f"Generated {len(scan_points)} scan points.")
 
-    if not scan_points:
-        print("No scan points generated. Check grid size or chunks.")
-        search_status["status"] = "error"
-        return
+        if plan_cache is not None:
+            plan_cache.put(cache_key, scan_points)
 
-    print(f"Generated {len(scan_points)} scan points.")
+    # Start from whichever end of the route is nearest the rover
+    if optimize_route_order:
+        location = vehicle.location.global_frame
+        if location.lat is not None and location.lon is not None:
+            scan_points = orient_route(scan_points, (location.lat, location.lon))
 
     # Update search status with waypoints
     search_status["waypoints"] = scan_points
-
-    # Visualize chunks and scan points
-    visualize_chunks_and_scan(polygon_coords, chunk_polygons, scan_points)
+    search_status["progress"] = 0
+    publish_plan(scan_points)
+
+    # Visualize chunks and scan points in the background, off the mission's critical path
+    if plan_visualization:
+        threading.Thread(
+            target=visualize_chunks_and_scan,
+            args=(polygon_coords, chunk_polygons, scan_points),
+            daemon=True,
+        ).start()
+
+    if mission_mode:
+        # Arm in GUIDED, then let the autopilot drive the uploaded mission
+        arm_and_set_mode()
+        search_status["status"] = "completed" if run_scan_mission(scan_points) else "error"
+        return
 
     # Arm and begin scanning
     arm_and_set_mode()
 
-    for scan_point in scan_points:
+    for index, scan_point in enumerate(scan_points):
+        search_status["progress"] = index
         try:
             # Create a geospatial plot_id
-            plot_id = f"PLOT_{round(scan_point[0],5)}_{round(scan_point[1], 5)}"
+            plot_id = plot_id_for(scan_point)
             print(f"Moving to scan point: {scan_point} with plot_id: {plot_id}")
-            goto_location(scan_point[0], scan_point[1])
-            publish_scan_data(scan_point, plot_id)
+            if goto_location(scan_point[0], scan_point[1]):
+                publish_scan_data(scan_point, plot_id)
         except Exception as e:
             print(f"Error during scanning at point {scan_point}: {e}")
 
@@ -453,6 +797,9 @@ if __name__ == "__main__":
         # Connect to vehicle
         connect_vehicle()
 
+        if plan_cache_enabled:
+            plan_cache = PlanCache(plan_cache_dir, plan_cache_max_bytes)
+
         # Connect to MQTT broker
         connect_mqtt()
 
@@ -464,9 +811,17 @@ if __name__ == "__main__":
         mqtt_loop_thread = threading.Thread(target=mqtt_client.loop_forever, daemon=True)
         mqtt_loop_thread.start()
 
+        # Upload scan data through the on-disk buffer
+        if store_and_forward:
+            scan_buffer = ScanBuffer(scan_buffer_path, scan_buffer_max_messages)
+            forwarder_thread = threading.Thread(target=scan_forwarder, daemon=True)
+            forwarder_thread.start()
+
         # Perform the search operation
         perform_search()
 
+        drain_scan_buffer()
+
     except KeyboardInterrupt:
         print("Interrupted by user.")
         search_status["status"] = "error"
@@ -478,4 +833,6 @@ if __name__ == "__main__":
             vehicle.close()
         if mqtt_client:
             mqtt_client.disconnect()
-            print("MQTT connection closed.")
\ No newline at end of file
+            print("MQTT connection closed.")
+        if scan_buffer:
+            scan_buffer.close()
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Persistent cache of computed scan plans.
+
+Plans are keyed by a content hash of the normalized survey polygon and the
+planning parameters, and stored as raw float64 (lat, lon) arrays in .npy
+files. The directory is kept under a size budget by evicting the least
+recently used plans.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import shapely
+
+# Coordinates are snapped to ~1 cm so that re-sent copies of the same field hit
+COORDINATE_PRECISION = 1e-7
+
+
+class PlanCache:
+    def __init__(self, directory="plan_cache", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, polygon, **params):
+        """
+        Hash a polygon together with the parameters that shape its plan.
+        The polygon is snapped and normalized first, so the vertex order,
+        starting vertex and orientation it arrived in do not matter.
+        """
+        canonical = shapely.normalize(shapely.set_precision(polygon, COORDINATE_PRECISION))
+        digest = hashlib.sha256(shapely.to_wkb(canonical))
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        """Return the cached (N, 2) waypoint array for `key`, or None."""
+        path = self.path(key)
+        try:
+            waypoints = np.load(path, allow_pickle=False)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # Mark as recently used for eviction
+        os.utime(path)
+        return waypoints
+
+    def put(self, key, waypoints):
+        """Store a waypoint list/array and evict old plans beyond the size budget."""
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(waypoints, dtype=np.float64), allow_pickle=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,173 @@
+"""
+Travel-distance optimization of a multi-chunk scan plan.
+
+Each chunk keeps its boustrophedon pattern, but the optimizer chooses the
+order in which chunks are visited and, per chunk, one of four equivalent
+ways to walk it (as planned, reversed, every row mirrored, or both) so the
+empty transits between chunks are as short as possible. Chunks are ordered
+with a nearest-neighbour tour refined by 2-opt, then each chunk's variant
+is re-chosen against its neighbours.
+"""
+from math import cos, hypot, radians
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+
+
+def distance_m(a, b):
+    """Equirectangular distance in metres between two (lat, lon) points; accurate at field scale."""
+    dy = radians(b[0] - a[0])
+    dx = radians(b[1] - a[1]) * cos(radians((a[0] + b[0]) / 2))
+    return EARTH_RADIUS_M * hypot(dx, dy)
+
+
+def path_length_m(points):
+    """Total length in metres of a path through (lat, lon) points."""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 2:
+        return 0.0
+    mean_lat = np.radians(points[:, 0].mean())
+    dy = np.radians(np.diff(points[:, 0]))
+    dx = np.radians(np.diff(points[:, 1])) * np.cos(mean_lat)
+    return EARTH_RADIUS_M * float(np.hypot(dx, dy).sum())
+
+
+def chunk_variants(pattern):
+    """
+    The four ways to walk a chunk's snake pattern: as planned, reversed,
+    with every row mirrored, and mirrored-and-reversed. Variants 2k and
+    2k + 1 are each other's reverse.
+    """
+    points = np.asarray(pattern, dtype=np.float64)
+    # Rows are runs of points sharing a latitude
+    breaks = np.flatnonzero(np.diff(points[:, 0]) != 0) + 1
+    mirrored = np.concatenate([row[::-1] for row in np.split(points, breaks)])
+    return [points, points[::-1], mirrored, mirrored[::-1]]
+
+
+class ChunkRoute:
+    def __init__(self, pattern):
+        self.variants = chunk_variants(pattern)
+        self.entries = [tuple(v[0]) for v in self.variants]
+        self.exits = [tuple(v[-1]) for v in self.variants]
+        self.lengths = [path_length_m(v) for v in self.variants]
+
+
+def reverse_variant(variant):
+    return variant ^ 1
+
+
+def nearest_neighbour_order(chunks):
+    remaining = set(range(1, len(chunks)))
+    order = [(0, min(range(4), key=lambda v: chunks[0].lengths[v]))]
+    while remaining:
+        exit_point = chunks[order[-1][0]].exits[order[-1][1]]
+        best = min(
+            ((i, v) for i in remaining for v in range(4)),
+            key=lambda c: distance_m(exit_point, chunks[c[0]].entries[c[1]]) + chunks[c[0]].lengths[c[1]],
+        )
+        order.append(best)
+        remaining.discard(best[0])
+    return order
+
+
+def two_opt(chunks, order, max_passes=20):
+    """Reverse sub-sequences of chunks (walking each reversed) while that shortens the transits."""
+
+    def entry(k):
+        return chunks[order[k][0]].entries[order[k][1]]
+
+    def exit_(k):
+        return chunks[order[k][0]].exits[order[k][1]]
+
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                # Reversing i..j makes the walk enter at exit(j) and leave at entry(i)
+                before = after = 0.0
+                if i > 0:
+                    before += distance_m(exit_(i - 1), entry(i))
+                    after += distance_m(exit_(i - 1), exit_(j))
+                if j < n - 1:
+                    before += distance_m(exit_(j), entry(j + 1))
+                    after += distance_m(entry(i), entry(j + 1))
+                if after < before - 1e-6:
+                    order[i : j + 1] = [(index, reverse_variant(v)) for index, v in reversed(order[i : j + 1])]
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def refine_variants(chunks, order, max_passes=5):
+    """Re-pick each chunk's variant given its neighbours' fixed endpoints."""
+    for _ in range(max_passes):
+        improved = False
+        for k, (index, current) in enumerate(order):
+            chunk = chunks[index]
+            previous_exit = chunks[order[k - 1][0]].exits[order[k - 1][1]] if k > 0 else None
+            next_entry = chunks[order[k + 1][0]].entries[order[k + 1][1]] if k < len(order) - 1 else None
+
+            def cost(variant):
+                total = chunk.lengths[variant]
+                if previous_exit is not None:
+                    total += distance_m(previous_exit, chunk.entries[variant])
+                if next_entry is not None:
+                    total += distance_m(chunk.exits[variant], next_entry)
+                return total
+
+            best = min(range(4), key=cost)
+            if cost(best) < cost(current) - 1e-6:
+                order[k] = (index, best)
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def optimize_route(chunk_patterns):
+    """
+    Order chunk scan patterns to minimize total travel. Returns the combined
+    list of [lat, lon] waypoints. The route is independent of where the rover
+    starts; use `orient_route` to pick the end nearest the rover.
+    """
+    chunks = [ChunkRoute(pattern) for pattern in chunk_patterns if len(pattern)]
+    if not chunks:
+        return []
+
+    order = nearest_neighbour_order(chunks)
+    order = two_opt(chunks, order)
+    order = refine_variants(chunks, order)
+
+    return np.concatenate([chunks[index].variants[variant] for index, variant in order]).tolist()
+
+
+def orient_route(route, start):
+    """Reverse the route if the rover at `start` (lat, lon) is closer to its last waypoint."""
+    if start is None or len(route) < 2:
+        return route
+    if distance_m(start, route[-1]) < distance_m(start, route[0]):
+        return route[::-1]
+    return route
+
+
+def route_report(before, after, start=None, speed=1.0, waypoint_overhead=0.0):
+    """Distance (m) and mission time estimate (s) for the planned and optimized routes."""
+
+    def summary(route):
+        distance = path_length_m(route)
+        if start is not None and len(route):
+            distance += distance_m(start, route[0])
+        return distance, distance / speed + len(route) * waypoint_overhead
+
+    before_distance, before_time = summary(before)
+    after_distance, after_time = summary(after)
+    return {
+        "before_m": before_distance,
+        "after_m": after_distance,
+        "saved_m": before_distance - after_distance,
+        "before_s": before_time,
+        "after_s": after_time,
+    }
@@ -0,0 +1,53 @@
+"""
+Bounded on-disk store-and-forward buffer for scan messages.
+
+Readings are appended to a SQLite table as they are taken and only deleted
+once the broker has acknowledged the batch that carried them, so a survey
+keeps its data while the rover is out of range. When the buffer is full the
+oldest readings are discarded first.
+"""
+import json
+import sqlite3
+import threading
+
+
+class ScanBuffer:
+    def __init__(self, path="scan_buffer.sqlite3", max_messages=100000):
+        self.max_messages = max_messages
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS readings (id INTEGER PRIMARY KEY AUTOINCREMENT, message TEXT NOT NULL)"
+        )
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def append(self, message):
+        """Store a message; drops the oldest ones if the buffer is over capacity."""
+        with self.lock:
+            cursor = self.db.execute("INSERT INTO readings (message) VALUES (?)", (json.dumps(message),))
+            # Ids are monotonic, so everything at or below this id is outside the ring
+            oldest_kept = cursor.lastrowid - self.max_messages
+            if oldest_kept > 0:
+                self.db.execute("DELETE FROM readings WHERE id <= ?", (oldest_kept,))
+
+    def peek(self, limit):
+        """Return up to `limit` of the oldest (id, message) pairs without removing them."""
+        with self.lock:
+            rows = self.db.execute("SELECT id, message FROM readings ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(row_id, json.loads(message)) for row_id, message in rows]
+
+    def ack(self, ids):
+        """Remove messages that were delivered."""
+        if not ids:
+            return
+        with self.lock:
+            self.db.execute("DELETE FROM readings WHERE id BETWEEN ? AND ?", (min(ids), max(ids)))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,98 @@
+"""
+Ingest throughput benchmark against the configured (local) broker and Redis.
+
+Starts N ingest worker processes, publishes a burst of soil readings spread
+over many rovers and measures how long it takes until every plot is stored.
+
+    python bench_ingest.py --workers 1 2 4 --rovers 64 --messages 20000
+"""
+import argparse
+import json
+import time
+import paho.mqtt.client as mqtt
+from config import CONFIG
+from main import start_ingest_workers
+from src.db import FLEET_GEO_KEY, db, index_key
+
+
+def bench_rover_ids(rovers):
+    return [f"bench{i}" for i in range(rovers)]
+
+
+def clear(rover_ids):
+    for rover_id in rover_ids:
+        keys = list(db.client.scan_iter(f"rover_{rover_id}:*"))
+        if keys:
+            db.client.delete(*keys)
+        members = [member for member, _ in db.client.zscan_iter(FLEET_GEO_KEY, match=f"{rover_id}|*")]
+        if members:
+            db.client.zrem(FLEET_GEO_KEY, *members)
+
+
+def stored_count(rover_ids):
+    pipe = db.client.pipeline(transaction=False)
+    for rover_id in rover_ids:
+        pipe.zcard(index_key(rover_id))
+    return sum(pipe.execute())
+
+
+def publish_burst(rover_ids, messages):
+    client = mqtt.Client()
+    client.connect(host=CONFIG.MQTT_HOST, port=CONFIG.MQTT_PORT)
+    client.loop_start()
+
+    for i in range(messages):
+        rover_id = rover_ids[i % len(rover_ids)]
+        payload = {
+            "plot_id": f"PLOT_{i}",
+            "details": {"lat": 12.5, "lon": 76.9, "soil_pH": 6.8, "nitrogen_ppm": 40},
+        }
+        client.publish(f"ground/{rover_id}/data", json.dumps(payload), qos=1)
+
+    return client
+
+
+def run(workers, rovers, messages, timeout):
+    rover_ids = bench_rover_ids(rovers)
+    clear(rover_ids)
+
+    processes = start_ingest_workers(workers)
+    # Give the workers time to connect and subscribe before publishing
+    time.sleep(2)
+
+    start = time.perf_counter()
+    client = publish_burst(rover_ids, messages)
+
+    stored = 0
+    while stored < messages and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+        stored = stored_count(rover_ids)
+    elapsed = time.perf_counter() - start
+
+    client.loop_stop()
+    client.disconnect()
+    for process in processes:
+        process.terminate()
+        process.join()
+    clear(rover_ids)
+
+    return stored, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rovers", type=int, default=64)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    print(f"mode={CONFIG.INGEST_MODE} sharding={CONFIG.INGEST_SHARDING} rovers={args.rovers} messages={args.messages}")
+    print(f"{'workers':>8} {'stored':>8} {'seconds':>8} {'msg/s':>10}")
+    for workers in args.workers:
+        stored, elapsed = run(workers, args.rovers, args.messages, args.timeout)
+        print(f"{workers:>8} {stored:>8} {elapsed:>8.2f} {stored / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import dotenv
 import os
 import json
+import multiprocessing
 
 dotenv.load_dotenv()
 
@@ -17,9 +18,48 @@ class CONFIG:
     MQTT_USER = os.getenv("MQTT_USER", None)
     MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", None)
 
+    # "sync" writes every message from the MQTT callback, "batch" queues them
+    # for a worker thread that flushes pipelined micro-batches, "async" runs
+    # the asyncio ingest service
+    INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 200))
+    INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", 0.05))
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 10000))
+    # Number of ingest processes and how they split the fleet: "hash" on the
+    # rover id (keeps per-rover ordering) or "share" ($share/ group subscription)
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+    INGEST_SHARDING = os.getenv("INGEST_SHARDING", "hash")
+    INGEST_ASYNC_CONSUMERS = int(os.getenv("INGEST_ASYNC_CONSUMERS", 64))
+    REDIS_ASYNC_POOL_SIZE = int(os.getenv("REDIS_ASYNC_POOL_SIZE", 32))
+
+    # Page size used when /data/<rover_id> is paginated or streamed
+    DATA_PAGE_SIZE = int(os.getenv("DATA_PAGE_SIZE", 500))
+
+    # Live plot stream (/stream/<rover_id>): max frames per second per client,
+    # per-client buffer before it is told to resync, keep-alive interval
+    PUSH_MAX_RATE = float(os.getenv("PUSH_MAX_RATE", 2))
+    PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", 1000))
+    PUSH_HEARTBEAT = float(os.getenv("PUSH_HEARTBEAT", 15))
+
     HOST = os.getenv("HOST")
     PORT = int(os.getenv("PORT", 8827))
 
+    # "dev" uses Flask's built-in server, "production" runs gunicorn with
+    # SERVER_WORKERS processes of SERVER_THREADS threads each
+    SERVER_MODE = os.getenv("SERVER_MODE", "dev")
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+    SERVER_THREADS = int(os.getenv("SERVER_THREADS", 8))
+    # Each open /stream/<rover_id> holds a thread for as long as it is
+    # connected, so streams get their own SERVER_STREAMS threads per process
+    # on top of SERVER_THREADS. That caps live dashboards at
+    # SERVER_WORKERS * SERVER_STREAMS; further streams get a 503.
+    SERVER_STREAMS = int(os.getenv("SERVER_STREAMS", 64))
+    SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", 30))
+    # Redis connections per process: one per request thread plus the live
+    # stream subscription and some headroom
+    REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", SERVER_THREADS + 4))
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+
     # ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
     # GRIDLINES_TOKEN = os.getenv("GRIDLINES_TOKEN")
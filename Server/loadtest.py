@@ -0,0 +1,84 @@
+"""
+HTTP load test for the data endpoints.
+
+Fires requests from concurrent keep-alive connections and reports requests/sec
+and latency percentiles, e.g. against the dev server and then the production
+server:
+
+    python loadtest.py --url http://localhost:8827/data/255 --concurrency 32 --requests 5000
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def worker(url, count, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+        except Exception as e:
+            errors.append(repr(e))
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+    conn.close()
+
+
+def percentile(values, fraction):
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    latencies, errors = [], []
+    per_worker = max(1, args.requests // args.concurrency)
+    threads = [
+        threading.Thread(target=worker, args=(args.url, per_worker, latencies, errors))
+        for _ in range(args.concurrency)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"All requests failed: {errors[:5]}")
+        return
+
+    latencies.sort()
+    print(f"url={args.url} concurrency={args.concurrency}")
+    print(f"requests: {len(latencies)} ok, {len(errors)} failed in {elapsed:.2f}s")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(
+        "latency ms: "
+        f"p50={percentile(latencies, 0.50) * 1000:.1f} "
+        f"p90={percentile(latencies, 0.90) * 1000:.1f} "
+        f"p99={percentile(latencies, 0.99) * 1000:.1f} "
+        f"max={latencies[-1] * 1000:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
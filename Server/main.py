@@ -1,17 +1,46 @@
 from multiprocessing import Process
-from src.server import run_server
+from config import CONFIG
+from src.db import db
+from src.server import run_server, run_server_production
 from src.mqtt import run_mqtt
 
 
+def get_ingest_target():
+    if CONFIG.INGEST_MODE == "async":
+        from src.async_ingest import run_mqtt_async
+
+        return run_mqtt_async
+    return run_mqtt
+
+
+def get_server_target():
+    if CONFIG.SERVER_MODE == "production":
+        return run_server_production
+    return run_server
+
+
+def start_ingest_workers(count=CONFIG.INGEST_WORKERS):
+    """Starts `count` ingest processes, each owning one shard of the rover fleet."""
+    target = get_ingest_target()
+    workers = [Process(target=target, args=(i, count)) for i in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
 def main():
-    p1 = Process(target=run_server)
-    p2 = Process(target=run_mqtt)
+    imported = db.migrate_legacy_plots()
+    if imported:
+        print(f"Imported {imported} plots from legacy rover blobs")
 
+    p1 = Process(target=get_server_target())
     p1.start()
-    p2.start()
+
+    workers = start_ingest_workers()
 
     p1.join()
-    p2.join()
+    for worker in workers:
+        worker.join()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+import asyncio
+import signal
+import zlib
+import aiomqtt
+from config import CONFIG
+from .db import AsyncRedisDB
+from .mqtt import IngestShard, decode_payload, parse_data_messages
+
+
+class AsyncIngestService:
+    """
+    Single-core ingest for many rovers: one asyncio MQTT reader feeds bounded
+    per-consumer queues and `consumers` tasks write to Redis concurrently.
+    Readings are routed to a consumer by rover id so each rover's plots are
+    still written in arrival order.
+
+    There is no flow control towards the broker: when the consumer queues
+    fill up the reader waits, paho keeps reading the socket into aiomqtt's
+    incoming queue, and once that holds `queue_size` messages further ones
+    are discarded. Those are counted as `dropped` in the ingest stats.
+    """
+
+    def __init__(
+        self,
+        shard=None,
+        consumers=CONFIG.INGEST_ASYNC_CONSUMERS,
+        queue_size=CONFIG.INGEST_QUEUE_SIZE,
+    ):
+        self.shard = shard or IngestShard()
+        self.name = str(self.shard.index)
+        self.consumers = consumers
+        self.queue_size = queue_size
+        per_consumer = max(1, queue_size // consumers)
+        self.queues = [asyncio.Queue(maxsize=per_consumer) for _ in range(consumers)]
+        self.stopping = asyncio.Event()
+        self.db = AsyncRedisDB()
+
+        self.received = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {
+            "mode": "async",
+            "consumers": self.consumers,
+            "queue_size": self.queue_size,
+            "queue_depth": sum(q.qsize() for q in self.queues),
+            "received": self.received,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    def incoming_queue_type(self):
+        """aiomqtt incoming message queue that counts the messages it has to discard."""
+        service = self
+
+        class DropCountingQueue(asyncio.Queue):
+            def put_nowait(self, item):
+                try:
+                    super().put_nowait(item)
+                except asyncio.QueueFull:
+                    service.dropped += 1
+                    raise
+
+        return DropCountingQueue
+
+    def queue_for(self, rover_id):
+        return self.queues[zlib.crc32(rover_id.encode()) % self.consumers]
+
+    async def consume(self, queue):
+        while True:
+            rover_id, plot_id, details = await queue.get()
+            try:
+                await self.db.upsert_plot(rover_id, plot_id, details)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print("EXCEPTION ON ASYNC INGEST")
+                print(e)
+            finally:
+                queue.task_done()
+
+    async def report_stats(self):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                await self.db.set_ingest_stats(self.stats(), self.name)
+            except Exception as e:
+                print("EXCEPTION ON INGEST STATS")
+                print(e)
+
+    async def read(self, client):
+        async for msg in client.messages:
+            topic = msg.topic.value
+            if not self.shard.owns(topic.split("/")[1]):
+                continue
+            try:
+                readings = parse_data_messages(topic, decode_payload(msg.payload))
+            except Exception as e:
+                print("EXCEPTION ON MESSAGE")
+                print(e)
+                continue
+
+            for reading in readings:
+                self.received += 1
+                await self.queue_for(reading[0]).put(reading)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        workers = [asyncio.create_task(self.consume(q)) for q in self.queues]
+        reporter = asyncio.create_task(self.report_stats())
+
+        try:
+            async with aiomqtt.Client(
+                hostname=CONFIG.MQTT_HOST,
+                port=CONFIG.MQTT_PORT,
+                # username=CONFIG.MQTT_USER,
+                # password=CONFIG.MQTT_PASSWORD,
+                keepalive=65535,
+                max_queued_incoming_messages=self.queue_size,
+                queue_type=self.incoming_queue_type(),
+            ) as client:
+                await client.subscribe(self.shard.topic())
+                print("Async ingest subscribed to", self.shard.topic())
+
+                reader = asyncio.create_task(self.read(client))
+                await self.stopping.wait()
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+
+            # Drain what was already accepted before tearing the workers down
+            print("Async ingest shutting down, draining queues...")
+            await asyncio.gather(*(q.join() for q in self.queues))
+        finally:
+            for task in workers + [reporter]:
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            await self.db.set_ingest_stats(self.stats(), self.name)
+            await self.db.close()
+
+
+def run_mqtt_async(shard_index=0, shard_count=1):
+    asyncio.run(AsyncIngestService(IngestShard(shard_index, shard_count)).run())
@@ -0,0 +1,113 @@
+"""
+Compact binary encoding for soil scan messages published on ground/<id>/data.
+
+A message starts with MAGIC (never a valid first byte of JSON) and a version
+byte, so the server can tell it apart from the JSON format and decode both.
+
+Version 1 layout (big endian):
+    B   magic
+    B   version
+    B   plot_id length, followed by the UTF-8 plot_id
+    d d lat, lon
+    B*4 soil_type, soil_colour, texture, irrigation_suitability (enum codes)
+    H*11 soil_pH, organic_content, moisture_content, bulk_density (x100),
+         nitrogen_ppm, phosphorus_ppm, potassium_ppm,
+         cation_exchange_capacity, electrical_conductivity, porosity,
+         water_holding_capacity (x100)
+
+Batches (store-and-forward uploads) use BATCH_VERSION:
+    B   magic
+    B   batch version
+    H   message count, then per message an H length and a version 1 message
+
+This is the server's decoding side of Rover/soil_codec.py; the enum tables
+and field order must stay identical to the rover's.
+"""
+import struct
+
+MAGIC = 0xA5
+VERSION = 1
+BATCH_VERSION = 0x81
+
+HEADER = struct.Struct(">BB")
+BATCH_HEADER = struct.Struct(">BBH")
+LENGTH = struct.Struct(">H")
+BODY = struct.Struct(">dd4B11H")
+
+SOIL_TYPES = ("Red Sandy Loam", "Laterite", "Coastal Alluvium")
+SOIL_COLOURS = (
+    "Reddish Brown",
+    "Light Red",
+    "Terra Cotta",
+    "Rusty Red",
+    "Brown Red",
+    "Dark Red",
+    "Dark Brown",
+    "Brown",
+    "Light Brown",
+)
+TEXTURES = ("Sandy Loam", "Loamy Clay", "Fine Loam")
+IRRIGATION = ("Cauvery River Belt",)
+
+ENUM_FIELDS = (
+    ("soil_type", SOIL_TYPES),
+    ("soil_colour", SOIL_COLOURS),
+    ("texture", TEXTURES),
+    ("irrigation_suitability", IRRIGATION),
+)
+
+# (field, scale): values are sent as round(value * scale) in an unsigned short
+NUMERIC_FIELDS = (
+    ("soil_pH", 100),
+    ("organic_content", 100),
+    ("moisture_content", 100),
+    ("bulk_density", 100),
+    ("nitrogen_ppm", 1),
+    ("phosphorus_ppm", 1),
+    ("potassium_ppm", 1),
+    ("cation_exchange_capacity", 100),
+    ("electrical_conductivity", 100),
+    ("porosity", 100),
+    ("water_holding_capacity", 100),
+)
+
+
+def is_compact(payload):
+    return len(payload) >= HEADER.size and payload[0] == MAGIC
+
+
+def decode(payload):
+    """
+    Decodes a compact payload back into a {"plot_id", "details"} message, or a
+    batch into {"batch": [message, ...]}.
+    """
+    magic, version = HEADER.unpack_from(payload, 0)
+    if magic == MAGIC and version == BATCH_VERSION:
+        return {"batch": decode_batch(payload)}
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"unsupported compact payload version {version}")
+
+    offset = HEADER.size
+    length = payload[offset]
+    plot_id = bytes(payload[offset + 1 : offset + 1 + length]).decode()
+    values = BODY.unpack_from(payload, offset + 1 + length)
+
+    details = {"lat": values[0], "lon": values[1]}
+    for (field, table), code in zip(ENUM_FIELDS, values[2:6]):
+        details[field] = table[code]
+    for (field, scale), value in zip(NUMERIC_FIELDS, values[6:]):
+        details[field] = value if scale == 1 else round(value / scale, 2)
+
+    return {"plot_id": plot_id, "details": details}
+
+
+def decode_batch(payload):
+    _, _, count = BATCH_HEADER.unpack_from(payload, 0)
+    offset = BATCH_HEADER.size
+    messages = []
+    for _ in range(count):
+        (length,) = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        messages.append(decode(payload[offset : offset + length]))
+        offset += length
+    return messages
@@ -1,22 +1,444 @@
+import json
+import math
 import redis
+import redis.asyncio
 from config import CONFIG
 
 
+# Upserts one plot atomically: bumps the rover's version counter, stores the
+# plot details in the per-rover hash and (re)indexes the plot by that version.
+# Running count/sum/sum-of-squares per numeric soil field are kept in the
+# stats hash, and each field has a sorted set of plot values for min/max.
+# A previous reading of the same plot is subtracted first, so overwrites
+# don't skew the aggregates. Plots with a location are also added to the
+# rover's GEO set and to the fleet-wide one (as "<rover_id>|<plot_id>").
+# Finally the versioned plot is published on the rover's update channel.
+# KEYS: plots hash, plot index (sorted set), version counter, stats hash,
+#       rover geo set, fleet geo set
+# ARGV: plot_id, details (JSON), field sorted set key prefix, rover_id,
+#       lon, lat (empty when the plot has no usable location), update channel
+UPSERT_PLOT_SCRIPT = """
+local not_soil = {lat = true, lon = true, latitude = true, longitude = true}
+
+local function apply(details_json, sign)
+    local ok, details = pcall(cjson.decode, details_json)
+    if not ok or type(details) ~= 'table' then
+        return
+    end
+    for field, value in pairs(details) do
+        if type(field) == 'string' and type(value) == 'number' and not not_soil[field] then
+            redis.call('HINCRBY', KEYS[4], field .. ':count', sign)
+            redis.call('HINCRBYFLOAT', KEYS[4], field .. ':sum', string.format('%.17g', sign * value))
+            redis.call('HINCRBYFLOAT', KEYS[4], field .. ':sum_sq', string.format('%.17g', sign * value * value))
+            if sign > 0 then
+                redis.call('ZADD', ARGV[3] .. field, value, ARGV[1])
+            else
+                redis.call('ZREM', ARGV[3] .. field, ARGV[1])
+            end
+        end
+    end
+end
+
+local version = redis.call('INCR', KEYS[3])
+local previous = redis.call('HGET', KEYS[1], ARGV[1])
+if previous then
+    apply(previous, -1)
+end
+apply(ARGV[2], 1)
+
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], version, ARGV[1])
+if ARGV[5] ~= '' then
+    redis.call('GEOADD', KEYS[5], ARGV[5], ARGV[6], ARGV[1])
+    redis.call('GEOADD', KEYS[6], ARGV[5], ARGV[6], ARGV[4] .. '|' .. ARGV[1])
+end
+redis.call('PUBLISH', ARGV[7],
+    '{"plot_id":' .. cjson.encode(ARGV[1]) .. ',"version":' .. version .. ',"details":' .. ARGV[2] .. '}')
+return version
+"""
+
+FLEET_GEO_KEY = "plots:geo"
+
+# Redis GEO only accepts latitudes inside the Web Mercator range
+MAX_GEO_LAT = 85.05112878
+EARTH_RADIUS_M = 6371000
+
+
+def upsert_keys(rover_id):
+    return [
+        plots_key(rover_id),
+        index_key(rover_id),
+        version_key(rover_id),
+        stats_key(rover_id),
+        geo_key(rover_id),
+        FLEET_GEO_KEY,
+    ]
+
+
+def upsert_args(rover_id, plot_id, details):
+    location = plot_location(plot_id, details)
+    lon, lat = location if location else ("", "")
+    return [
+        plot_id,
+        json.dumps(details),
+        field_key(rover_id, ""),
+        rover_id,
+        lon,
+        lat,
+        updates_channel(rover_id),
+    ]
+
+
+def plot_location(plot_id, details):
+    """
+    Returns the (lon, lat) of a plot from its details, falling back to the
+    geospatial plot_id (PLOT_<lat>_<lon>), or None if neither is usable.
+    """
+    try:
+        lat, lon = float(details["lat"]), float(details["lon"])
+    except (KeyError, TypeError, ValueError):
+        try:
+            _, lat, lon = str(plot_id).split("_")
+            lat, lon = float(lat), float(lon)
+        except ValueError:
+            return None
+
+    if not (-MAX_GEO_LAT <= lat <= MAX_GEO_LAT and -180 <= lon <= 180):
+        return None
+    return lon, lat
+
+
+def plots_key(rover_id):
+    return f"rover_{rover_id}:plots"
+
+
+def index_key(rover_id):
+    return f"rover_{rover_id}:index"
+
+
+def version_key(rover_id):
+    return f"rover_{rover_id}:version"
+
+
+def stats_key(rover_id):
+    return f"rover_{rover_id}:stats"
+
+
+def field_key(rover_id, field):
+    return f"rover_{rover_id}:field:{field}"
+
+
+def geo_key(rover_id):
+    return f"rover_{rover_id}:geo"
+
+
+def updates_channel(rover_id):
+    return f"rover_{rover_id}:updates"
+
+
 class RedisDB:
-    def __init__(self):
-        self.client = redis.Redis(
+    def __init__(self, max_connections=CONFIG.REDIS_POOL_SIZE):
+        # Connections are shared by all threads of a process. redis-py resets
+        # the pool after a fork, so each server/ingest worker gets its own.
+        self.pool = redis.BlockingConnectionPool(
             host=CONFIG.REDIS_HOST,
             port=CONFIG.REDIS_PORT,
             db=CONFIG.REDIS_DB,
             username=CONFIG.REDIS_USERNAME,
             password=CONFIG.REDIS_PASSWORD,
+            max_connections=max_connections,
+            timeout=CONFIG.REDIS_POOL_TIMEOUT,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        self.upsert_plot_script = self.client.register_script(UPSERT_PLOT_SCRIPT)
+
+    def upsert_plot(self, rover_id, plot_id, details):
+        """Stores a single plot reading, replacing any previous reading for the plot."""
+        return self.upsert_plot_script(
+            keys=upsert_keys(rover_id),
+            args=upsert_args(rover_id, plot_id, details),
+        )
+
+    def upsert_plots(self, plots, stats=None, stats_name="0"):
+        """
+        Stores a batch of (rover_id, plot_id, details) readings in one pipeline.
+        Optional ingest stats are written to the worker's `ingest_stats:<name>` hash in the same round trip.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for rover_id, plot_id, details in plots:
+            self.upsert_plot_script(
+                keys=upsert_keys(rover_id),
+                args=upsert_args(rover_id, plot_id, details),
+                client=pipe,
+            )
+        if stats:
+            pipe.hset(f"ingest_stats:{stats_name}", mapping=stats)
+        return pipe.execute()
+
+    def migrate_legacy_plots(self):
+        """
+        Imports the JSON list blobs that used to hold a rover's plots under
+        `rover_<id>` into the plots hash and version index, then deletes them.
+        Safe to run from several processes and to re-run after a crash.
+        Returns the number of plots imported.
+        """
+        imported = 0
+        for key in self.client.scan_iter(match="rover_*", _type="string"):
+            key = key.decode()
+            name, _, suffix = key.partition(":")
+            if suffix in ("", "legacy"):
+                imported += self.migrate_legacy_rover(name[len("rover_") :])
+        return imported
+
+    def migrate_legacy_rover(self, rover_id):
+        legacy_key = f"rover_{rover_id}"
+        claimed_key = f"{legacy_key}:legacy"
+        # RENAME is atomic, so only one process imports a given blob
+        try:
+            self.client.rename(legacy_key, claimed_key)
+        except redis.ResponseError:
+            pass
+        raw = self.client.get(claimed_key)
+        if raw is None:
+            return 0
+
+        # The blob lists the newest reading first; replay oldest first so versions
+        # follow it, and never overwrite a plot ingested since the upgrade
+        existing = set(self.client.hkeys(plots_key(rover_id)))
+        plots = [
+            (rover_id, plot["plot_id"], plot.get("details", {}))
+            for plot in reversed(json.loads(raw))
+            if plot.get("plot_id") is not None and str(plot["plot_id"]).encode() not in existing
+        ]
+        if plots:
+            self.upsert_plots(plots)
+        self.client.delete(claimed_key)
+        return len(plots)
+
+    def get_ingest_stats(self):
+        """Returns the last reported stats of every ingest worker, keyed by worker name."""
+        stats = {}
+        for key in self.client.scan_iter("ingest_stats:*"):
+            name = key.decode().split(":", 1)[1]
+            stats[name] = {k.decode(): v.decode() for k, v in self.client.hgetall(key).items()}
+        return stats
+
+    def get_stats(self, rover_id):
+        """
+        Returns per-field aggregates for a rover's current plots, computed from
+        the running sums kept at ingest time rather than by scanning the plots.
+        """
+        raw = {k.decode(): float(v) for k, v in self.client.hgetall(stats_key(rover_id)).items()}
+        fields = sorted({key.rsplit(":", 1)[0] for key in raw})
+
+        pipe = self.client.pipeline(transaction=False)
+        for field in fields:
+            pipe.zrange(field_key(rover_id, field), 0, 0, withscores=True)
+            pipe.zrange(field_key(rover_id, field), -1, -1, withscores=True)
+        extremes = pipe.execute()
+
+        stats = {}
+        for i, field in enumerate(fields):
+            count = int(raw.get(f"{field}:count", 0))
+            if count <= 0:
+                continue
+            total = raw.get(f"{field}:sum", 0.0)
+            total_sq = raw.get(f"{field}:sum_sq", 0.0)
+            mean = total / count
+            lowest, highest = extremes[2 * i], extremes[2 * i + 1]
+            stats[field] = {
+                "count": count,
+                "sum": total,
+                "sum_sq": total_sq,
+                "mean": mean,
+                "std": max(total_sq / count - mean * mean, 0.0) ** 0.5,
+                "min": lowest[0][1] if lowest else None,
+                "max": highest[0][1] if highest else None,
+            }
+        return stats
+
+    def get_plots_by_member(self, members, rover_id=None):
+        """
+        Loads plot details for GEO set members: plot ids when searching a
+        single rover, "<rover_id>|<plot_id>" when searching the whole fleet.
+        """
+        refs = []
+        for member in members:
+            member = member.decode()
+            refs.append((rover_id, member) if rover_id is not None else tuple(member.split("|", 1)))
+
+        pipe = self.client.pipeline(transaction=False)
+        for ref_rover, plot_id in refs:
+            pipe.hget(plots_key(ref_rover), plot_id)
+        details = pipe.execute()
+
+        return [
+            {"rover_id": ref_rover, "plot_id": plot_id, "details": json.loads(raw)}
+            for (ref_rover, plot_id), raw in zip(refs, details)
+            if raw is not None
+        ]
+
+    def get_plots_in_bbox(self, min_lon, min_lat, max_lon, max_lat, rover_id=None, limit=None):
+        """Returns plots inside a lon/lat bounding box, for one rover or the whole fleet."""
+        key = geo_key(rover_id) if rover_id is not None else FLEET_GEO_KEY
+        center_lat = (min_lat + max_lat) / 2
+        # GEOSEARCH boxes are metric, so search a box that covers the bbox at
+        # its widest latitude and drop the corners that fall outside
+        widest_lat = 0 if min_lat <= 0 <= max_lat else min(abs(min_lat), abs(max_lat))
+        width = EARTH_RADIUS_M * math.radians(max_lon - min_lon) * math.cos(math.radians(widest_lat))
+        height = EARTH_RADIUS_M * math.radians(max_lat - min_lat)
+
+        results = self.client.geosearch(
+            key,
+            longitude=(min_lon + max_lon) / 2,
+            latitude=center_lat,
+            width=width * 1.01 + 1,
+            height=height * 1.01 + 1,
+            unit="m",
+            withcoord=True,
+        )
+        members = [
+            member
+            for member, (lon, lat) in results
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat
+        ]
+        return self.get_plots_by_member(members[:limit], rover_id)
+
+    def get_plots_near(self, lon, lat, radius, rover_id=None, limit=None):
+        """Returns plots within `radius` metres of a point, nearest first."""
+        key = geo_key(rover_id) if rover_id is not None else FLEET_GEO_KEY
+        members = self.client.geosearch(
+            key,
+            longitude=lon,
+            latitude=lat,
+            radius=radius,
+            unit="m",
+            sort="ASC",
+            count=limit,
+        )
+        return self.get_plots_by_member(members, rover_id)
+
+    def get_plots_page(self, rover_id, cursor=None, limit=CONFIG.DATA_PAGE_SIZE, fields=None):
+        """
+        Returns up to `limit` plots updated before version `cursor` (newest
+        first) and the cursor of the next page, or None on the last page.
+        `fields` optionally projects each plot's details.
+
+        A plot rewritten while a client is paging moves above the cursor and
+        is not on later pages; clients that need every plot should follow up
+        with get_plots_since from the version they started at.
+        """
+        max_version = f"({cursor}" if cursor is not None else "+inf"
+        page = self.client.zrevrangebyscore(
+            index_key(rover_id), max_version, "-inf", start=0, num=limit, withscores=True
+        )
+        if not page:
+            return [], None
+
+        plots = self.load_plots(rover_id, [plot_id for plot_id, _ in page], fields)
+        next_cursor = int(page[-1][1]) if len(page) == limit else None
+        return plots, next_cursor
+
+    def load_plots(self, rover_id, plot_ids, fields=None):
+        """Loads {"plot_id", "details"} for the given ids, skipping removed plots."""
+        details = self.client.hmget(plots_key(rover_id), plot_ids)
+
+        plots = []
+        for plot_id, raw in zip(plot_ids, details):
+            if raw is None:
+                continue
+            plot_details = json.loads(raw)
+            if fields:
+                plot_details = {field: plot_details[field] for field in fields if field in plot_details}
+            plots.append({"plot_id": plot_id.decode(), "details": plot_details})
+        return plots
+
+    def get_version(self, rover_id):
+        """Returns the rover's latest plot version, 0 if nothing was ingested yet."""
+        return int(self.client.get(version_key(rover_id)) or 0)
+
+    def get_plots_since(self, rover_id, since, limit=None, fields=None):
+        """
+        Returns plots written after version `since`, oldest change first, each
+        with its `version`, plus the version the caller should pass next time.
+        With `limit` the changes come in slices; the returned version then
+        points at the last plot included.
+        """
+        version = self.get_version(rover_id)
+        changed = self.client.zrangebyscore(
+            index_key(rover_id),
+            f"({since}",
+            "+inf",
+            start=0 if limit else None,
+            num=limit,
+            withscores=True,
+        )
+        if not changed:
+            return [], max(version, since)
+
+        plot_ids = [plot_id for plot_id, _ in changed]
+        details = self.client.hmget(plots_key(rover_id), plot_ids)
+
+        plots = []
+        for (plot_id, plot_version), raw in zip(changed, details):
+            if raw is None:
+                continue
+            plot_details = json.loads(raw)
+            if fields:
+                plot_details = {field: plot_details[field] for field in fields if field in plot_details}
+            plots.append({"plot_id": plot_id.decode(), "version": int(plot_version), "details": plot_details})
+
+        if limit and len(changed) == limit:
+            version = int(changed[-1][1])
+        else:
+            version = max(version, int(changed[-1][1]))
+        return plots, version
+
+    def iter_plots(self, rover_id, fields=None, page_size=CONFIG.DATA_PAGE_SIZE):
+        """
+        Yields every plot for a rover, most recently updated first. The plot
+        ids are read once up front and details are loaded page by page, so a
+        plot rewritten mid-stream is still yielded (with its latest details).
+        """
+        plot_ids = self.client.zrevrange(index_key(rover_id), 0, -1)
+        for start in range(0, len(plot_ids), page_size):
+            yield from self.load_plots(rover_id, plot_ids[start : start + page_size], fields)
+
+    def get_plots(self, rover_id):
+        """Returns every plot for a rover, most recently updated first."""
+        plot_ids = self.client.zrevrange(index_key(rover_id), 0, -1)
+        if not plot_ids:
+            return []
+        return self.load_plots(rover_id, plot_ids)
+
+
+class AsyncRedisDB:
+    """asyncio counterpart of RedisDB for the async ingest service, backed by a bounded connection pool."""
+
+    def __init__(self, max_connections=CONFIG.REDIS_ASYNC_POOL_SIZE):
+        self.pool = redis.asyncio.BlockingConnectionPool(
+            host=CONFIG.REDIS_HOST,
+            port=CONFIG.REDIS_PORT,
+            db=CONFIG.REDIS_DB,
+            username=CONFIG.REDIS_USERNAME,
+            password=CONFIG.REDIS_PASSWORD,
+            max_connections=max_connections,
+        )
+        self.client = redis.asyncio.Redis(connection_pool=self.pool)
+        self.upsert_plot_script = self.client.register_script(UPSERT_PLOT_SCRIPT)
+
+    async def upsert_plot(self, rover_id, plot_id, details):
+        return await self.upsert_plot_script(
+            keys=upsert_keys(rover_id),
+            args=upsert_args(rover_id, plot_id, details),
         )
 
-    def set_key(self, key, value):
-        self.client.set(key, value)
+    async def set_ingest_stats(self, stats, name="0"):
+        await self.client.hset(f"ingest_stats:{name}", mapping=stats)
 
-    def get_key(self, key):
-        return self.client.get(key)
+    async def close(self):
+        await self.client.aclose()
+        await self.pool.disconnect()
 
 
 db = RedisDB()
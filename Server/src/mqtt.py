@@ -1,51 +1,198 @@
 import math
 import json
+import queue
+import threading
+import time
+import zlib
 import paho.mqtt.client as mqtt
 from config import CONFIG
+from . import codec
 from .db import db
 
 
 def get_mqtt_client_for_publish():
-    """Returns a configured MQTT client for publishing messages."""
+    """Returns a connected MQTT client for publishing messages, with its network loop running."""
     client = mqtt.Client()
     # Uncomment if credentials are needed
     # client.username_pw_set(CONFIG.MQTT_USER, CONFIG.MQTT_PASSWORD)
     client.connect(host=CONFIG.MQTT_HOST, port=CONFIG.MQTT_PORT)
+    client.loop_start()
     return client
 
 
+class IngestShard:
+    """
+    Identifies which slice of the rover fleet an ingest process owns.
+
+    In "hash" mode every shard subscribes to `ground/+/data` and keeps only the
+    rovers whose id hashes to it, so a rover is always handled by the same
+    process and its readings stay in order. In "share" mode the broker splits
+    the load through a `$share/` group subscription; this avoids the fan-out
+    but per-rover ordering then depends on the broker's dispatch strategy.
+    """
+
+    def __init__(self, index=0, count=1, mode=CONFIG.INGEST_SHARDING):
+        self.index = index
+        self.count = count
+        self.mode = mode
+
+    def topic(self):
+        if self.count > 1 and self.mode == "share":
+            return "$share/ingest/ground/+/data"
+        return "ground/+/data"
+
+    def owns(self, rover_id):
+        if self.count == 1 or self.mode == "share":
+            return True
+        return zlib.crc32(rover_id.encode()) % self.count == self.index
+
+
 def on_connect(client, userdata, flags, rc):
     print("Connected with result code " + str(rc))
     # Subscribe to the desired pattern
-    client.subscribe("ground/+/data")
+    client.subscribe(userdata["shard"].topic())
 
 
-def handle_data_message(msg, payload):
-    rover_id = msg.topic.split("/")[1]
-    plot_id = payload.get("plot_id")
-    details = payload.get("details", {})
+def decode_payload(raw):
+    """Decodes a data message in either the JSON or the compact binary format."""
+    if codec.is_compact(raw):
+        return codec.decode(raw)
+    return json.loads(raw)
 
-    key = f"rover_{rover_id}"
 
-    to_update = [{"plot_id": plot_id, "details": details}]
+def parse_data_messages(topic, payload):
+    """
+    Returns the (rover_id, plot_id, details) readings carried by a data
+    message: a single reading, or a store-and-forward {"batch": [...]}.
+    Messages without a plot_id are skipped.
+    """
+    rover_id = topic.split("/")[1]
+    messages = payload.get("batch", []) if "batch" in payload else [payload]
 
-    existing_data = db.get_key(key)
-    if existing_data:
-        as_list = list(json.loads(existing_data))
-        for x in as_list:
-            if plot_id != x.get("plot_id"):
-                to_update.append(x)
+    readings = []
+    for message in messages:
+        plot_id = message.get("plot_id")
+        if plot_id is not None:
+            readings.append((rover_id, plot_id, message.get("details", {})))
+    return readings
 
-    db.set_key(key, json.dumps(to_update))
+
+def handle_data_message(msg, payload):
+    readings = parse_data_messages(msg.topic, payload)
+    if not readings:
+        print("DATA MESSAGE WITHOUT PLOT ID:", msg.topic)
+        return
+
+    if len(readings) == 1:
+        db.upsert_plot(*readings[0])
+    else:
+        db.upsert_plots(readings)
+
+
+class IngestWorker:
+    """
+    Decouples the paho network loop from Redis: the MQTT callback only enqueues
+    decoded readings and a background thread flushes them in micro-batches,
+    bounded by `batch_size` and `flush_interval`, one pipeline per batch.
+    """
+
+    def __init__(
+        self,
+        name="0",
+        batch_size=CONFIG.INGEST_BATCH_SIZE,
+        flush_interval=CONFIG.INGEST_FLUSH_INTERVAL,
+        queue_size=CONFIG.INGEST_QUEUE_SIZE,
+    ):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.received = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.queue_high_water = 0
+
+    def submit(self, rover_id, plot_id, details):
+        self.received += 1
+        try:
+            self.queue.put_nowait((rover_id, plot_id, details))
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        depth = self.queue.qsize()
+        if depth > self.queue_high_water:
+            self.queue_high_water = depth
+        return True
+
+    def stats(self):
+        return {
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "queue_size": self.queue_size,
+            "queue_depth": self.queue.qsize(),
+            "queue_high_water": self.queue_high_water,
+            "received": self.received,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        try:
+            self.batches += 1
+            self.written += len(batch)
+            db.upsert_plots(batch, stats=self.stats(), stats_name=self.name)
+        except Exception as e:
+            self.written -= len(batch)
+            self.failed += len(batch)
+            print("EXCEPTION ON INGEST BATCH")
+            print(e)
+
+    def run(self):
+        while True:
+            self.flush(self.next_batch())
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
 
 
 def on_message(client, userdata, msg):
     try:
-        message_contents = msg.payload.decode()
+        if not userdata["shard"].owns(msg.topic.split("/")[1]):
+            return
+
+        worker = userdata["worker"]
+        if worker is not None:
+            if msg.topic.startswith("ground/") and msg.topic.endswith("/data"):
+                for reading in parse_data_messages(msg.topic, decode_payload(msg.payload)):
+                    worker.submit(*reading)
+            return
 
-        print(f"Received message: {msg.topic} -> {message_contents}")
+        print(f"Received message: {msg.topic} -> {msg.payload}")
 
-        payload = json.loads(message_contents)
+        payload = decode_payload(msg.payload)
         print("PARSED:")
         print(payload)
 
@@ -58,8 +205,15 @@ def on_message(client, userdata, msg):
         print(userdata, msg)
 
 
-def run_mqtt():
-    client = mqtt.Client()
+def run_mqtt(shard_index=0, shard_count=1):
+    shard = IngestShard(shard_index, shard_count)
+
+    worker = None
+    if CONFIG.INGEST_MODE == "batch":
+        worker = IngestWorker(name=str(shard_index))
+        worker.start()
+
+    client = mqtt.Client(userdata={"shard": shard, "worker": worker})
     # Uncomment this if you need to use credentials
     # client.username_pw_set(CONFIG.MQTT_USER, CONFIG.MQTT_PASSWORD)
     client.on_connect = on_connect
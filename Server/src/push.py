@@ -0,0 +1,129 @@
+import json
+import math
+import queue
+import threading
+import time
+from config import CONFIG
+from .db import db
+
+
+class PlotSubscriber:
+    """One connected dashboard: a bounded buffer of plot updates for a single rover."""
+
+    def __init__(self, rover_id, queue_size=CONFIG.PUSH_QUEUE_SIZE):
+        self.rover_id = rover_id
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, plot):
+        try:
+            self.queue.put_nowait(plot)
+        except queue.Full:
+            # The client fell too far behind; it will be told to resync with ?since=
+            self.overflowed = True
+
+
+class PlotFanout:
+    """
+    Serves every live stream in this server process from a single Redis
+    subscription to the ingest update channels, instead of one broker or
+    Redis connection per browser tab.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, rover_id):
+        subscriber = PlotSubscriber(rover_id)
+        with self.lock:
+            self.subscribers.setdefault(rover_id, set()).add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            rover_subscribers = self.subscribers.get(subscriber.rover_id, set())
+            rover_subscribers.discard(subscriber)
+            if not rover_subscribers:
+                self.subscribers.pop(subscriber.rover_id, None)
+
+    def dispatch(self, channel, raw):
+        # Channels look like rover_<id>:updates
+        rover_id = channel[len("rover_") : -len(":updates")]
+        with self.lock:
+            targets = list(self.subscribers.get(rover_id, ()))
+        if not targets:
+            return
+
+        plot = json.loads(raw)
+        for subscriber in targets:
+            subscriber.offer(plot)
+
+    def run(self):
+        while True:
+            try:
+                pubsub = db.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe("rover_*:updates")
+                for message in pubsub.listen():
+                    self.dispatch(message["channel"].decode(), message["data"].decode())
+            except Exception as e:
+                print("EXCEPTION ON PLOT FANOUT")
+                print(e)
+                time.sleep(1)
+
+
+fanout = PlotFanout()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def stream_rover_updates(rover_id, max_rate=CONFIG.PUSH_MAX_RATE, heartbeat=CONFIG.PUSH_HEARTBEAT):
+    """
+    Yields server-sent events for a rover: a `hello` with the current data
+    version, then `plots` frames. Bursts are coalesced so a client receives at
+    most `max_rate` frames per second, with repeated plots collapsed to their
+    latest reading.
+    """
+    subscriber = fanout.subscribe(rover_id)
+    if not (max_rate > 0 and math.isfinite(max_rate)):
+        max_rate = CONFIG.PUSH_MAX_RATE
+    min_interval = 1 / max_rate
+    try:
+        yield sse_event("hello", json.dumps({"version": db.get_version(rover_id)}))
+
+        last_frame = 0.0
+        while True:
+            try:
+                first = subscriber.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+
+            wait = last_frame + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            pending = [first]
+            while True:
+                try:
+                    pending.append(subscriber.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                yield sse_event("resync", json.dumps({"version": db.get_version(rover_id)}))
+            else:
+                latest = {}
+                for plot in pending:
+                    latest[plot["plot_id"]] = plot
+                yield sse_event("plots", json.dumps(list(latest.values())))
+            last_frame = time.monotonic()
+    finally:
+        fanout.unsubscribe(subscriber)
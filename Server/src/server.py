@@ -1,14 +1,35 @@
 from flask_cors import CORS
 import json
-from flask import Flask
+import math
+import os
+import threading
+from flask import Flask, Response, request
 from config import CONFIG
 from .db import db
 from .mqtt import get_mqtt_client_for_publish
+from .push import stream_rover_updates
 
 app = Flask(__name__)
 cors = CORS(app)
 
-mqtt_client = get_mqtt_client_for_publish()
+# Created lazily in each server process: a client made before gunicorn forks
+# would share one socket between workers with no network loop running
+mqtt_client = None
+mqtt_client_pid = None
+mqtt_client_lock = threading.Lock()
+
+
+# Threads of this process that may be held by live streams
+stream_slots = threading.BoundedSemaphore(CONFIG.SERVER_STREAMS)
+
+
+def get_mqtt_client():
+    global mqtt_client, mqtt_client_pid
+    with mqtt_client_lock:
+        if mqtt_client is None or mqtt_client_pid != os.getpid():
+            mqtt_client = get_mqtt_client_for_publish()
+            mqtt_client_pid = os.getpid()
+        return mqtt_client
 
 
 @app.route("/")
@@ -18,29 +39,177 @@ def home():
 
 @app.post("/send/<rover_id>")
 def send_rover_data(rover_id):
-    redis_key = f"rover_{rover_id}"
-
-    redis_data = db.get_key(redis_key)
-    if redis_data:
-        data = json.loads(redis_data)
-
+    data = db.get_plots(rover_id)
+    if data:
         print("EXISTING DATA:", data)
         print("PUBLISHING DATA TO:", f"ai/crops/{rover_id}/request", json.dumps(data))
 
-        mqtt_client.publish(f"ai/crops/{rover_id}/request", json.dumps(data))
+        get_mqtt_client().publish(f"ai/crops/{rover_id}/request", json.dumps(data))
 
         return "Data found and sent", 200
     else:
         return "Data not found", 500
 
 
+def stream_json_array(items):
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(item)
+    yield "]"
+
+
+def stream_ndjson(items):
+    for item in items:
+        yield json.dumps(item) + "\n"
+
+
 @app.get("/data/<rover_id>")
 def get_rover_data(rover_id):
-    redis_key = f"rover_{rover_id}"
+    """
+    Returns a rover's plots, newest first.
+
+    ?fields=soil_pH,nitrogen_ppm     only include these detail fields
+    ?limit=<n>&cursor=<c>            one page as {"plots": [...], "next_cursor": c}
+    ?format=ndjson                   stream one plot per line
+    ?since=<version>[&limit=<n>]     only plots changed after that version as
+                                     {"version": v, "plots": [...]}
+    Without limit/cursor the full list is streamed as a JSON array.
+
+    Every response carries the rover's data version as a weak ETag, so a
+    repeated poll with If-None-Match gets a 304 when nothing changed.
+    """
+    etag = str(db.get_version(rover_id))
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    fields = request.args.get("fields")
+    fields = [field for field in fields.split(",") if field] if fields else None
+
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor", type=int)
+    since = request.args.get("since", type=int)
+    if since is not None:
+        plots, version = db.get_plots_since(
+            rover_id, since, max(limit, 1) if limit is not None else None, fields
+        )
+        response = app.json.response({"version": version, "plots": plots})
+    elif limit is not None or cursor is not None:
+        plots, next_cursor = db.get_plots_page(
+            rover_id, cursor, max(limit or CONFIG.DATA_PAGE_SIZE, 1), fields
+        )
+        response = app.json.response({"plots": plots, "next_cursor": next_cursor})
+    else:
+        plots = db.iter_plots(rover_id, fields)
+        if request.args.get("format") == "ndjson":
+            response = Response(stream_ndjson(plots), mimetype="application/x-ndjson")
+        else:
+            response = Response(stream_json_array(plots), mimetype="application/json")
+
+    response.set_etag(etag, weak=True)
+    return response
+
 
-    redis_data = db.get_key(redis_key)
-    return redis_data
+@app.get("/stream/<rover_id>")
+def stream_rover_data(rover_id):
+    """
+    Server-sent events with plots as they are ingested. `max_rate` caps the
+    frames per second for this client (bounded by PUSH_MAX_RATE; missing,
+    non-positive or non-finite values get PUSH_MAX_RATE).
+
+    At most SERVER_STREAMS streams are served per process so they cannot
+    take the threads that other requests need; beyond that this returns 503.
+    """
+    if not stream_slots.acquire(blocking=False):
+        return Response("Too many live streams, retry later", status=503, headers={"Retry-After": "30"})
+
+    max_rate = request.args.get("max_rate", type=float)
+    if max_rate is None or not math.isfinite(max_rate) or max_rate <= 0:
+        max_rate = CONFIG.PUSH_MAX_RATE
+    max_rate = min(max_rate, CONFIG.PUSH_MAX_RATE)
+    response = Response(
+        stream_rover_updates(rover_id, max_rate=max_rate),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+@app.get("/stats/<rover_id>")
+def get_rover_stats(rover_id):
+    return db.get_stats(rover_id)
+
+
+@app.get("/plots")
+def get_plots_in_bbox():
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(x) for x in request.args["bbox"].split(","))
+    except (KeyError, ValueError):
+        return "bbox must be min_lon,min_lat,max_lon,max_lat", 400
+    if not (min_lon <= max_lon and min_lat <= max_lat):
+        return "bbox must be min_lon,min_lat,max_lon,max_lat with min <= max", 400
+
+    plots = db.get_plots_in_bbox(
+        min_lon,
+        min_lat,
+        max_lon,
+        max_lat,
+        rover_id=request.args.get("rover"),
+        limit=request.args.get("limit", type=int),
+    )
+    return Response(json.dumps(plots), mimetype="application/json")
+
+
+@app.get("/plots/near")
+def get_plots_near():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius = request.args.get("r", type=float)
+    if lat is None or lon is None or radius is None:
+        return "lat, lon and r (metres) are required", 400
+    if not radius > 0:
+        return "r must be a positive number of metres", 400
+
+    plots = db.get_plots_near(
+        lon,
+        lat,
+        radius,
+        rover_id=request.args.get("rover"),
+        limit=request.args.get("limit", type=int),
+    )
+    return Response(json.dumps(plots), mimetype="application/json")
+
+
+@app.get("/ingest/stats")
+def get_ingest_stats():
+    return db.get_ingest_stats()
 
 
 def run_server():
-    app.run(host=CONFIG.HOST, port=CONFIG.PORT)
+    # Live streams hold a request thread each
+    app.run(host=CONFIG.HOST, port=CONFIG.PORT, threaded=True)
+
+
+def run_server_production():
+    """
+    Serves the app with gunicorn: SERVER_WORKERS processes, each with
+    SERVER_THREADS threads for requests plus SERVER_STREAMS threads that
+    live streams may hold.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{CONFIG.HOST or '0.0.0.0'}:{CONFIG.PORT}")
+            self.cfg.set("workers", CONFIG.SERVER_WORKERS)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", CONFIG.SERVER_THREADS + CONFIG.SERVER_STREAMS)
+            self.cfg.set("timeout", CONFIG.SERVER_TIMEOUT)
+            self.cfg.set("keepalive", 5)
+
+        def load(self):
+            return app
+
+    ProductionServer().run()